@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Thin client for the AI Typing Assistant daemon
+
+Sends a prompt to `python ai_typing_assistant.py --daemon` over its Unix
+socket and prints the reply. Only the standard library is imported, so it
+starts in milliseconds and is suitable for editor integrations and hotkeys.
+
+    python ai_client.py "Explain list comprehensions"
+    echo "Fix the grammar: me and him goes" | python ai_client.py --model gpt-4o
+    python ai_client.py --status
+"""
+
+import os
+import sys
+import json
+import socket
+import argparse
+
+def default_socket_path():
+    """DAEMON_SOCKET from config.py, or the daemon's default location"""
+    try:
+        import config
+        path = getattr(config, "DAEMON_SOCKET", None)
+    except ImportError:
+        path = None
+    return path or os.path.join(os.path.expanduser("~"), "Documents", "248Tech", "assistant.sock")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Send a prompt to the AI Typing Assistant daemon")
+    parser.add_argument("prompt", nargs="*", help="prompt text (read from stdin when omitted)")
+    parser.add_argument("--model", help="model for this request (default: the daemon's)")
+    parser.add_argument("--socket", default=None, help="daemon socket path")
+    parser.add_argument("--status", action="store_true", help="show daemon model, usage and budget")
+    parser.add_argument("--shutdown", action="store_true", help="stop the daemon")
+    parser.add_argument("--cost", action="store_true", help="print the request cost to stderr")
+    options = parser.parse_args(argv)
+
+    if options.status:
+        request = {"op": "status"}
+    elif options.shutdown:
+        request = {"op": "shutdown"}
+    else:
+        prompt = " ".join(options.prompt) if options.prompt else sys.stdin.read()
+        request = {"op": "ask", "prompt": prompt, "model": options.model}
+
+    path = options.socket or default_socket_path()
+    try:
+        conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        conn.connect(path)
+    except (AttributeError, OSError) as e:
+        print(f"Could not reach the daemon at {path}: {e}", file=sys.stderr)
+        print("Start it with: python ai_typing_assistant.py --daemon", file=sys.stderr)
+        return 2
+
+    with conn, conn.makefile("rwb") as stream:
+        stream.write((json.dumps(request) + "\n").encode("utf-8"))
+        stream.flush()
+        for line in stream:
+            event = json.loads(line)
+            kind = event.get("type")
+            if kind == "delta":
+                sys.stdout.write(event["content"])
+                sys.stdout.flush()
+            elif kind == "done":
+                if request["op"] == "ask":
+                    sys.stdout.write("\n")
+                    if options.cost:
+                        print(f"{event['model']} • ${event['cost']:.6f} • ${event['total']:.2f} total", file=sys.stderr)
+                return 0
+            elif kind == "status":
+                print(json.dumps({k: v for k, v in event.items() if k != "type"}, indent=2))
+                return 0
+            elif kind == "error":
+                print(f"Error: {event['message']}", file=sys.stderr)
+                return 1
+    print("Daemon closed the connection without a reply", file=sys.stderr)
+    return 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -9,8 +9,16 @@ import time
 import signal
 import sys
 import random
+import hashlib
+import argparse
+import bisect
+import importlib
+import multiprocessing
+import socket
+import socketserver
 from datetime import datetime
-from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from concurrent.futures import ThreadPoolExecutor, TimeoutError, wait, FIRST_COMPLETED
 
 # === WINDOWS ANSI SUPPORT ===
 def enable_windows_ansi():
@@ -81,12 +89,79 @@ except ImportError:
     WRAP_INDENT = "  "
     HAS_API_KEY = False
 
+def get_config(name, default):
+    """Read an optional setting from config.py, falling back to a default"""
+    try:
+        import config
+    except ImportError:
+        return default
+    return getattr(config, name, default)
+
+# Optional OpenAI-compatible endpoint (e.g. the local stand-in from mock_server.py)
+BASE_URL = get_config("BASE_URL", None)
+if BASE_URL:
+    # Stand-in servers ignore the key, so the placeholder is good enough
+    HAS_API_KEY = True
+
+# Clipboard watch mode: poll interval bounds and settle time (seconds)
+WATCH_MIN_INTERVAL = get_config("WATCH_MIN_INTERVAL", 0.2)
+WATCH_MAX_INTERVAL = get_config("WATCH_MAX_INTERVAL", 2.0)
+WATCH_DEBOUNCE = get_config("WATCH_DEBOUNCE", 0.8)
+
+# Offline backend: optional "module:factory" returning a callable(prompt) -> reply,
+# and the number of worker processes it runs in (0 = in-process, batch uses all cores)
+LOCAL_BACKEND = get_config("LOCAL_BACKEND", None)
+LOCAL_WORKERS = get_config("LOCAL_WORKERS", 0)
+
+# Stable system preamble sent first with every online request (the cacheable prefix)
+SYSTEM_PROMPT = get_config("SYSTEM_PROMPT", "You are a helpful AI typing assistant. Answer clearly and concisely.")
+
+# Rolling summary of exchanges that left the context window: model used to
+# update it (None = offline extractive summary) and its size cap in characters
+SUMMARY_MODEL = get_config("SUMMARY_MODEL", None)
+SUMMARY_MAX_CHARS = get_config("SUMMARY_MAX_CHARS", 2000)
+
+# Online request timing: API_TIMEOUT caps a whole reply; the wait for the first
+# token and between chunks is learned from observed latency. Hedging sends a
+# second request when the first token is later than the observed p95, for at
+# most HEDGE_MAX_FRACTION of requests
+API_TIMEOUT = get_config("API_TIMEOUT", 30)
+HEDGE_REQUESTS = get_config("HEDGE_REQUESTS", False)
+HEDGE_MAX_FRACTION = get_config("HEDGE_MAX_FRACTION", 0.1)
+
+# Upstream calls run at once (daemon clients, fan-out branches); document mode
+# and hedging raise this as needed so calls don't queue behind each other
+REQUEST_CONCURRENCY = get_config("REQUEST_CONCURRENCY", 4)
+
+# Circuit breaker: consecutive outage-type failures before online requests
+# go straight to the local model, and seconds between recovery probes
+BREAKER_THRESHOLD = get_config("BREAKER_THRESHOLD", 3)
+BREAKER_PROBE_INTERVAL = get_config("BREAKER_PROBE_INTERVAL", 15)
+
+# Metrics export (Prometheus text format): localhost port for /metrics and/or
+# a textfile rewritten every METRICS_INTERVAL seconds (None = disabled)
+METRICS_PORT = get_config("METRICS_PORT", None)
+METRICS_TEXTFILE = get_config("METRICS_TEXTFILE", None)
+METRICS_INTERVAL = get_config("METRICS_INTERVAL", 15)
+
+# Document mode: chunk size for map requests, chunks processed at once,
+# and retries per chunk on rate limits or outages
+DOCUMENT_CHUNK_TOKENS = get_config("DOCUMENT_CHUNK_TOKENS", 2000)
+DOCUMENT_CONCURRENCY = get_config("DOCUMENT_CONCURRENCY", 4)
+DOCUMENT_RETRIES = get_config("DOCUMENT_RETRIES", 3)
+
+# Race and compare modes: models one prompt is sent to at the same time
+FANOUT_MODELS = get_config("FANOUT_MODELS", ["gpt-3.5-turbo", "gpt-4o"])
+
+# Daemon mode: Unix domain socket served by --daemon and used by ai_client.py
+DAEMON_SOCKET = get_config("DAEMON_SOCKET", None) or os.path.join(os.path.expanduser("~"), "Documents", "248Tech", "assistant.sock")
+
 # Initialize OpenAI client if API key is available
 client = None
 if HAS_API_KEY:
     try:
         from openai import OpenAI
-        client = OpenAI(api_key=API_KEY)
+        client = OpenAI(api_key=API_KEY, base_url=BASE_URL)
     except ImportError:
         HAS_API_KEY = False
 
@@ -133,8 +208,35 @@ LOCAL_RESPONSES = {
 # === GLOBAL STATE ===
 prompt_queue = queue.Queue()
 is_running = True
-executor = ThreadPoolExecutor(max_workers=2)
+# Upstream calls, with room for a hedge next to each when hedging is on
+executor = ThreadPoolExecutor(max_workers=max(REQUEST_CONCURRENCY, DOCUMENT_CONCURRENCY, len(FANOUT_MODELS))
+                              * (2 if HEDGE_REQUESTS else 1))
+usage_lock = threading.Lock()  # Guards the shared usage dict and usage.json
+reserved_cost = 0.0  # Worst-case cost of document requests in flight (guarded by usage_lock)
+MAX_CONTEXT_SIZE = 10000  # Characters of unfolded history sent as context; more triggers a fold
+CONTEXT_EXCHANGES = 5  # Recent exchanges kept verbatim after each fold
+HISTORY_MAX_EXCHANGES = 2 * CONTEXT_EXCHANGES  # Unfolded exchanges that trigger a fold
+summary_executor = ThreadPoolExecutor(max_workers=1)  # Serialises summary updates
+summary_state = None  # Cached {"summary": text, "offset": chat log byte offset folded so far}
+summary_lock = threading.Lock()  # Summary and offset are read and replaced together
 selected_model = None  # Will be set during model selection
+last_copied_hash = None  # Hash of the last reply we put on the clipboard
+inflight_lock = threading.Lock()
+inflight_requests = {}  # (model, messages) hash -> Future of the shared upstream call
+singleflight_stats = {"calls": 0, "shared": 0}
+latency_stats = None  # Cached latency histograms, keyed "model:prompt size"
+latency_lock = threading.Lock()
+hedge_lock = threading.Lock()
+hedge_stats = {"requests": 0, "hedged": 0, "wins": 0}
+breaker_lock = threading.Lock()
+breaker_state = {"failures": 0, "open": False, "recovered": False, "trips": 0}
+metrics_lock = threading.Lock()
+metrics = {"requests": {}, "tokens": {}, "cost": {}, "latency": {}}  # Session counters for export
+local_backend = None  # Offline backend loaded in this process
+local_pool = None  # LocalWorkerPool, started on first use
+local_pool_lock = threading.Lock()
+interrupt_lock = threading.Lock()
+foreground_cancel = None  # Event set by Ctrl+C to cancel the request awaited at the prompt
 
 # === UI HELPER FUNCTIONS ===
 def convert_latex_to_ascii(text):
@@ -458,13 +560,13 @@ def print_error_box(content):
         print(f"│ {content}")
         print(f"╰{'─' * 7}╯")
 
-def print_cost_summary(cost, total_cost, model):
-    """Display cost summary for the selected model"""
+def print_cost_summary(cost, total_cost, model, cache_ratio=None):
+    """Display cost summary for the selected model, with the prompt cache hit ratio if known"""
     if model == "local-llm":
         summary = f"[*] {model.upper()} • OFFLINE • No cost • No internet required"
         print_info_box("Cost Summary", summary, BRIGHT_GREEN if ANSI_ENABLED else "")
     else:
-        model_icon = "[*]" if model == "gpt-4o" else "[+]"
+        model_icon = "[*]" if model in ("gpt-4o", "compare") else "[+]"
         percentage = (total_cost / MAX_YEARLY_COST) * 100
         
         # Color based on usage percentage
@@ -479,6 +581,8 @@ def print_cost_summary(cost, total_cost, model):
             cost_color = ""
         
         summary = f"{model_icon} {model.upper()} • ${cost:.6f} • ${total_cost:.2f} / ${MAX_YEARLY_COST:.2f} ({percentage:.1f}%)"
+        if cache_ratio is not None:
+            summary += f" • {cache_ratio:.0%} cached"
         print_info_box("Cost Summary", summary, cost_color)
 
 # === SETUP ===
@@ -495,7 +599,7 @@ def ensure_dirs():
             open(CHAT_LOG, "w", encoding="utf-8").close()
         if not os.path.exists(USAGE_FILE):
             with open(USAGE_FILE, "w") as f:
-                json.dump({"input": 0, "output": 0, "total": 0.0}, f)
+                json.dump({"input": 0, "output": 0, "cached": 0, "total": 0.0}, f)
     except Exception as e:
         print_error_box(f"Error setting up directories: {e}")
         return False
@@ -513,74 +617,96 @@ def load_usage():
             # Validate data structure
             required_keys = ["input", "output", "total"]
             if all(key in data for key in required_keys):
+                data.setdefault("cached", 0)  # Older files predate cached-token tracking
                 return data
     except (FileNotFoundError, json.JSONDecodeError, KeyError):
         pass
-    return {"input": 0, "output": 0, "total": 0.0}
+    return {"input": 0, "output": 0, "cached": 0, "total": 0.0}
 
 def save_usage(data):
-    """Safely save usage data with error handling"""
+    """Save usage data atomically so readers (e.g. metrics scrapes) never see a partial file"""
     try:
         HOME_DIR = os.path.join(os.path.expanduser("~"), "Documents", "248Tech")
         LOG_DIR = os.path.join(HOME_DIR, "Logs")
         USAGE_FILE = os.path.join(LOG_DIR, "usage.json")
         
-        with open(USAGE_FILE, "w") as f:
+        tmp_file = USAGE_FILE + ".tmp"
+        with open(tmp_file, "w") as f:
             json.dump(data, f, indent=2)
+        os.replace(tmp_file, USAGE_FILE)
     except Exception as e:
         print_error_box(f"Error saving usage: {e}")
 
-def estimate_cost(model, input_t, output_t):
-    """Calculate cost with validation"""
+def estimate_tokens(text):
+    """Rough token count (about four characters per token)"""
+    return max(1, len(text) // 4)
+
+ONLINE_MODELS = ("gpt-3.5-turbo", "gpt-4o")  # Online models with pricing in estimate_cost
+PROBE_MODEL = "gpt-3.5-turbo"  # Cheapest online model, used for circuit breaker recovery probes
+
+def estimate_cost(model, input_t, output_t, cached_t=0):
+    """Calculate cost with validation; cached input tokens are billed at the cached rate"""
     PRICING = {
-        "gpt-3.5-turbo": {"input": 0.50, "output": 1.50},
-        "gpt-4o": {"input": 2.50, "output": 10.00}
+        "gpt-3.5-turbo": {"input": 0.50, "cached_input": 0.50, "output": 1.50},
+        "gpt-4o": {"input": 2.50, "cached_input": 1.25, "output": 10.00}
     }
     try:
         rate = PRICING[model]
-        return round((input_t / 1_000_000) * rate["input"] + (output_t / 1_000_000) * rate["output"], 6)
+        uncached_t = input_t - cached_t
+        return round((uncached_t / 1_000_000) * rate["input"] + (cached_t / 1_000_000) * rate["cached_input"]
+                     + (output_t / 1_000_000) * rate["output"], 6)
     except KeyError:
         return 0.0
 
 # === CHAT CONTEXT ===
-def load_context():
-    """Load recent chat context with size limits and error handling"""
+def context_start_offset(offset):
+    """Chat log byte offset where unfolded history begins, given the summary's offset"""
+    HOME_DIR = os.path.join(os.path.expanduser("~"), "Documents", "248Tech")
+    CHAT_LOG = os.path.join(HOME_DIR, "Logs", "Chat", "chat_log.txt")
+    size = os.path.getsize(CHAT_LOG)
+    
+    if offset is None or offset > size:
+        # First run or a truncated log: limit context size to prevent memory issues
+        offset = max(0, size - MAX_CONTEXT_SIZE)
+    return offset
+
+def history_size(exchanges):
+    """Characters of prompt and reply text in a list of (prompt, reply) pairs"""
+    return sum(len(prompt) + len(reply) for prompt, reply in exchanges)
+
+def load_context(offset):
+    """Load the exchanges after the summary's offset as (prompt, reply) pairs
+    
+    History only grows between folds, so consecutive requests share a prefix
+    that provider-side prompt caching can reuse. It never exceeds
+    MAX_CONTEXT_SIZE characters, even before an overdue fold has run.
+    """
     try:
-        HOME_DIR = os.path.join(os.path.expanduser("~"), "Documents", "248Tech")
-        LOG_DIR = os.path.join(HOME_DIR, "Logs")
-        CHAT_LOG = os.path.join(LOG_DIR, "Chat", "chat_log.txt")
-        
-        if not os.path.exists(CHAT_LOG):
-            return ""
-        
-        with open(CHAT_LOG, "r", encoding="utf-8") as f:
-            content = f.read()
-        
-        # Limit context size to prevent memory issues
-        MAX_CONTEXT_SIZE = 10000
-        if len(content) > MAX_CONTEXT_SIZE:
-            content = content[-MAX_CONTEXT_SIZE:]
-        
-        lines = content.splitlines()
+        entries = read_log_entries(context_start_offset(offset))
+    except FileNotFoundError:
+        return []
     except Exception as e:
         print_info_box("Warning", f"Could not load chat context: {e}", BRIGHT_YELLOW if ANSI_ENABLED else "")
-        return ""
+        return []
     
-    exchanges = []
-    current = []
-    CONTEXT_EXCHANGES = 5
-    
-    # Process lines in reverse order for recent context
-    for line in reversed(lines):
-        if line.startswith("You:") or line.startswith("Assistant:"):
-            current.insert(0, line)
-            if len(current) == 2:
-                exchanges.insert(0, "\n".join(current))
-                current = []
-        if len(exchanges) >= CONTEXT_EXCHANGES:
-            break
-    
-    return "\n\n".join(exchanges)
+    exchanges = [(prompt, reply) for _, prompt, reply in entries[-HISTORY_MAX_EXCHANGES:]]
+    while exchanges and history_size(exchanges) > MAX_CONTEXT_SIZE:
+        exchanges.pop(0)
+    return exchanges
+
+def build_messages(prompt):
+    """Lay out a request as stable preamble, summary, append-only history, new prompt"""
+    messages = [{"role": "system", "content": SYSTEM_PROMPT}]
+    # One snapshot, so a fold finishing meanwhile can't pair a new summary with old history
+    summary, offset = load_summary()
+    if summary:
+        messages.append({"role": "system", "content": f"Summary of earlier conversation:\n{summary}"})
+    for past_prompt, past_reply in load_context(offset):
+        messages.append({"role": "user", "content": past_prompt})
+        messages.append({"role": "assistant", "content": past_reply})
+    # Stripped the way the log parser returns it, so the next request repeats it byte for byte
+    messages.append({"role": "user", "content": prompt.strip()})
+    return messages
 
 def append_to_log(prompt, reply):
     """Safely append to chat log with error handling"""
@@ -597,6 +723,789 @@ def append_to_log(prompt, reply):
     except Exception as e:
         print_error_box(f"Error saving chat log: {e}")
 
+# === ROLLING SUMMARY ===
+def load_summary():
+    """Return (summary, offset) for older exchanges as one consistent snapshot (cached after first read)"""
+    global summary_state
+    with summary_lock:
+        if summary_state is None:
+            try:
+                HOME_DIR = os.path.join(os.path.expanduser("~"), "Documents", "248Tech")
+                SUMMARY_FILE = os.path.join(HOME_DIR, "Logs", "Chat", "summary.json")
+                with open(SUMMARY_FILE, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                summary_state = {"summary": str(data["summary"]), "offset": int(data["offset"])}
+            except (FileNotFoundError, json.JSONDecodeError, KeyError, TypeError, ValueError):
+                summary_state = {"summary": "", "offset": None}
+        return summary_state["summary"], summary_state["offset"]
+
+def save_summary(state):
+    """Write the rolling summary atomically so readers never see a partial file"""
+    try:
+        HOME_DIR = os.path.join(os.path.expanduser("~"), "Documents", "248Tech")
+        SUMMARY_FILE = os.path.join(HOME_DIR, "Logs", "Chat", "summary.json")
+        
+        tmp_file = SUMMARY_FILE + ".tmp"
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            json.dump(state, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_file, SUMMARY_FILE)
+    except Exception as e:
+        print_error_box(f"Error saving context summary: {e}")
+
+def read_log_entries(start):
+    """Parse chat log entries from a byte offset into (offset, prompt, reply) tuples"""
+    import re
+    
+    HOME_DIR = os.path.join(os.path.expanduser("~"), "Documents", "248Tech")
+    CHAT_LOG = os.path.join(HOME_DIR, "Logs", "Chat", "chat_log.txt")
+    
+    with open(CHAT_LOG, "rb") as f:
+        f.seek(start)
+        data = f.read()
+    
+    # Entries start with a "--- timestamp ---" line; text before the first one is skipped
+    markers = list(re.finditer(rb"^--- [^\n]* ---\r?\n", data, flags=re.MULTILINE))
+    entries = []
+    for i, marker in enumerate(markers):
+        end = markers[i + 1].start() if i + 1 < len(markers) else len(data)
+        body = data[marker.end():end].decode("utf-8", errors="replace")
+        prompt, _, reply = body.partition("\nAssistant: ")
+        if prompt.startswith("You: "):
+            prompt = prompt[len("You: "):]
+        entries.append((start + marker.start(), prompt.strip(), reply.strip()))
+    return entries
+
+def first_sentence(text, limit):
+    """First sentence of text on one line, truncated to limit characters"""
+    import re
+    
+    text = " ".join(text.split())
+    match = re.search(r"[.!?](\s|$)", text)
+    if match:
+        text = text[:match.end()].strip()
+    return text if len(text) <= limit else text[:limit - 3].rstrip() + "..."
+
+def summarize_extractive(summary, exchanges):
+    """Offline summary: one line per exchange, oldest lines dropped past the size cap"""
+    lines = [line for line in summary.splitlines() if line.strip()]
+    for prompt, reply in exchanges:
+        lines.append(f"- Asked: {first_sentence(prompt, 100)} | Answered: {first_sentence(reply, 160)}")
+    while len(lines) > 1 and len("\n".join(lines)) > SUMMARY_MAX_CHARS:
+        lines.pop(0)
+    return "\n".join(lines)
+
+def summarize_with_model(summary, exchanges, usage):
+    """Ask SUMMARY_MODEL to fold new exchanges into the summary, billing usage"""
+    transcript = "\n\n".join(f"You: {prompt}\nAssistant: {reply}" for prompt, reply in exchanges)
+    instructions = (
+        f"Update the running summary of a conversation with the new exchanges. "
+        f"Keep facts, decisions and open questions; stay under {SUMMARY_MAX_CHARS} characters. "
+        f"Reply with the updated summary only.\n\n"
+        f"Current summary:\n{summary or '(empty)'}\n\nNew exchanges:\n{transcript}"
+    )
+    response = client.chat.completions.create(
+        model=SUMMARY_MODEL,
+        messages=[{"role": "user", "content": instructions}],
+        timeout=API_TIMEOUT,
+    )
+    usage_data = getattr(response, "usage", None)
+    if usage_data:
+        details = getattr(usage_data, "prompt_tokens_details", None)
+        record_usage(SUMMARY_MODEL, {"prompt_tokens": usage_data.prompt_tokens,
+                                     "completion_tokens": usage_data.completion_tokens,
+                                     "cached_tokens": (getattr(details, "cached_tokens", 0) or 0) if details else 0}, usage)
+    return response.choices[0].message.content.strip()[:SUMMARY_MAX_CHARS]
+
+def update_summary(usage=None):
+    """Fold older exchanges into the rolling summary once history outgrows its caps
+    
+    A fold runs at HISTORY_MAX_EXCHANGES exchanges or MAX_CONTEXT_SIZE
+    characters and keeps at most CONTEXT_EXCHANGES exchanges within half the
+    character cap, so history can grow again before the next fold.
+    """
+    summary, offset = load_summary()
+    state = {"summary": summary, "offset": offset}
+    try:
+        offset = context_start_offset(offset)
+        
+        # Only the unfolded tail of the log is read, so updates stay cheap as it grows.
+        # Folding happens in blocks so the history prefix stays stable in between.
+        entries = read_log_entries(offset)
+        exchanges = [(prompt, reply) for _, prompt, reply in entries]
+        aged = []
+        if len(entries) > HISTORY_MAX_EXCHANGES or history_size(exchanges) > MAX_CONTEXT_SIZE:
+            kept = min(CONTEXT_EXCHANGES, len(entries))
+            while kept and history_size(exchanges[len(entries) - kept:]) > MAX_CONTEXT_SIZE // 2:
+                kept -= 1
+            aged = entries[:len(entries) - kept]
+        if aged:
+            exchanges = exchanges[:len(aged)]
+            summary = None
+            if SUMMARY_MODEL and client and usage is not None and usage["total"] < MAX_YEARLY_COST:
+                try:
+                    summary = summarize_with_model(state["summary"], exchanges, usage)
+                except Exception:
+                    summary = None  # Fall back to the offline summary
+            if not summary:
+                summary = summarize_extractive(state["summary"], exchanges)
+            state["summary"] = summary
+            if len(aged) < len(entries):
+                state["offset"] = entries[len(aged)][0]
+            else:
+                state["offset"] = aged[-1][0] + 1  # Past the last marker's start, so the parser skips it
+        elif state["offset"] is None:
+            state["offset"] = entries[0][0] if entries else offset
+        else:
+            return
+    except Exception as e:
+        print_info_box("Warning", f"Could not update context summary: {e}", BRIGHT_YELLOW if ANSI_ENABLED else "")
+        return
+    
+    with summary_lock:
+        summary_state.update(state)
+    save_summary(state)
+
+def schedule_summary_update(usage=None):
+    """Update the rolling summary in the background"""
+    try:
+        summary_executor.submit(update_summary, usage)
+    except RuntimeError:
+        pass  # Shutting down
+
+# === CLIPBOARD ===
+def clipboard_hash(text):
+    """Hash clipboard contents so changes can be compared cheaply"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def copy_to_clipboard(text):
+    """Copy text to the clipboard and remember it so watch mode ignores it"""
+    global last_copied_hash
+    last_copied_hash = clipboard_hash(text)
+    pyperclip.copy(text)
+
+# === COMPLETION CALLS ===
+class CompletionCall:
+    """One streamed upstream chat completion that can be cancelled from another thread"""
+    
+    def __init__(self, model, messages):
+        self.model = model
+        self.messages = messages
+        self.waiters = 1  # Callers still waiting on this call (guarded by inflight_lock)
+        self.cancelled = threading.Event()
+        self.lock = threading.Lock()
+        self.stream = None
+        self.future = None
+        self.started = None  # Set when a worker picks the call up; queueing doesn't count
+        self.first_token = None  # Seconds from start to the first content chunk
+        self.last_progress = None  # When the latest chunk arrived
+    
+    def start(self):
+        """Submit the call to the executor; the future resolves to a result dict"""
+        self.future = executor.submit(self.run)
+        return self
+    
+    def stalled(self, timeout, now):
+        """True once the call has waited longer than timeout for its first token or its next chunk"""
+        started = self.started
+        if started is None:
+            return False
+        if self.first_token is None:
+            return now - started > timeout
+        return now - self.last_progress > timeout
+    
+    def overran(self, now):
+        """True once the call has run longer than API_TIMEOUT in total"""
+        started = self.started
+        return started is not None and now - started > API_TIMEOUT
+    
+    def run(self):
+        self.started = time.perf_counter()
+        if self.cancelled.is_set():
+            # Cancelled while queued: nothing was sent, so nothing to bill
+            return {"content": "", "prompt_tokens": 0, "completion_tokens": 0, "cached_tokens": 0,
+                    "estimated": True, "cancelled": True, "latency": 0.0, "first_token": None}
+        
+        parts = []
+        usage_data = None
+        try:
+            stream = client.chat.completions.create(
+                model=self.model,
+                messages=self.messages,
+                stream=True,
+                stream_options={"include_usage": True},
+                timeout=API_TIMEOUT,
+            )
+            with self.lock:
+                self.stream = stream
+            if self.cancelled.is_set():
+                stream.close()
+            for chunk in stream:
+                self.last_progress = time.perf_counter()
+                if chunk.choices and chunk.choices[0].delta.content:
+                    if self.first_token is None:
+                        self.first_token = self.last_progress - self.started
+                    parts.append(chunk.choices[0].delta.content)
+                if getattr(chunk, "usage", None):
+                    usage_data = chunk.usage
+        except Exception:
+            # Closing the stream from cancel() surfaces here as a read error
+            if not self.cancelled.is_set():
+                raise
+        finally:
+            with self.lock:
+                stream, self.stream = self.stream, None
+            if stream is not None:
+                stream.close()
+        
+        content = "".join(parts)
+        cached_t = 0
+        if usage_data:
+            prompt_t = usage_data.prompt_tokens
+            completion_t = usage_data.completion_tokens
+            details = getattr(usage_data, "prompt_tokens_details", None)
+            cached_t = (getattr(details, "cached_tokens", 0) or 0) if details else 0
+        else:
+            # No usage report (cancelled mid-stream): estimate what was consumed
+            prompt_t = estimate_tokens("".join(m["content"] for m in self.messages))
+            completion_t = len(content) // 4
+        return {
+            "content": content,
+            "prompt_tokens": prompt_t,
+            "completion_tokens": completion_t,
+            "cached_tokens": cached_t,
+            "estimated": usage_data is None,
+            "cancelled": self.cancelled.is_set() and usage_data is None,
+            "latency": time.perf_counter() - self.started,
+            "first_token": self.first_token,
+        }
+    
+    def release(self):
+        """Stop waiting on the call; the last waiter to leave cancels it if still running"""
+        with inflight_lock:
+            self.waiters -= 1
+            last = self.waiters == 0
+        if last and not self.future.done():
+            self.cancel()
+    
+    def cancel(self):
+        """Stop generation by closing the stream; the future resolves to the partial result"""
+        self.cancelled.set()
+        with self.lock:
+            stream = self.stream
+        if stream is not None:
+            try:
+                stream.close()
+            except Exception:
+                pass
+
+def record_usage(model, result, usage):
+    """Add a call's tokens and cost to the usage totals; returns the cost"""
+    cached_t = result.get("cached_tokens", 0)
+    cost = estimate_cost(model, result["prompt_tokens"], result["completion_tokens"], cached_t)
+    with usage_lock:
+        usage["input"] += result["prompt_tokens"]
+        usage["output"] += result["completion_tokens"]
+        usage["cached"] = usage.get("cached", 0) + cached_t
+        usage["total"] += cost
+        save_usage(usage)
+    record_token_metrics(model, result["prompt_tokens"], result["completion_tokens"], cost, cached_t)
+    return cost
+
+def reserve_budget(usage, amount):
+    """Reserve a request's worst-case cost; False if it would not fit under the cap"""
+    global reserved_cost
+    with usage_lock:
+        if usage["total"] + reserved_cost + amount >= MAX_YEARLY_COST:
+            return False
+        reserved_cost += amount
+        return True
+
+def release_budget(amount):
+    """Return a reservation once the request has been billed"""
+    global reserved_cost
+    with usage_lock:
+        reserved_cost = max(0.0, reserved_cost - amount)
+
+def bill_when_done(call, usage):
+    """Bill a call we started but stopped waiting for once it finishes"""
+    def bill(future):
+        if not future.cancelled() and future.exception() is None:
+            record_usage(call.model, future.result(), usage)
+    call.future.add_done_callback(bill)
+
+# === REQUEST CANCELLATION ===
+CANCEL_POLL_INTERVAL = 0.1  # Seconds between checks for Ctrl+C while waiting on a request
+CANCEL_GRACE = 2.0  # Seconds to let cancelled streams close so partial usage is billed
+WATCHDOG_INTERVAL = 0.1  # Seconds between timeout and hedge checks on running calls
+
+class RequestCancelled(Exception):
+    """The user interrupted the request in progress"""
+
+def begin_foreground_request():
+    """Register the request the prompt is waiting on; returns its cancel Event"""
+    global foreground_cancel
+    with interrupt_lock:
+        foreground_cancel = threading.Event()
+        return foreground_cancel
+
+def end_foreground_request():
+    """Forget the foreground request so Ctrl+C exits again"""
+    global foreground_cancel
+    with interrupt_lock:
+        foreground_cancel = None
+
+def cancel_foreground_request():
+    """Cancel the foreground request; False if there is none or it is already cancelled"""
+    with interrupt_lock:
+        if foreground_cancel is None or foreground_cancel.is_set():
+            return False
+        foreground_cancel.set()
+        return True
+
+def wait_or_cancel(futures, timeout, cancel, return_when=FIRST_COMPLETED):
+    """wait() that also returns early once cancel is set"""
+    if cancel is None:
+        return wait(futures, timeout=timeout, return_when=return_when)
+    deadline = time.monotonic() + timeout
+    while True:
+        remaining = deadline - time.monotonic()
+        done, pending = wait(futures, timeout=max(0, min(remaining, CANCEL_POLL_INTERVAL)), return_when=return_when)
+        if done or cancel.is_set() or remaining <= CANCEL_POLL_INTERVAL:
+            return done, pending
+
+# === REQUEST DEDUPLICATION ===
+def request_key(model, messages):
+    """Hash a (model, messages) pair to identify identical requests"""
+    encoded = json.dumps([model, messages], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+def submit_completion(model, messages):
+    """Submit a chat completion, joining an identical request already in flight
+    
+    Returns (call, shared); shared is True when the upstream call (and its
+    cost) belongs to another caller.
+    """
+    key = request_key(model, messages)
+    with inflight_lock:
+        singleflight_stats["calls"] += 1
+        call = inflight_requests.get(key)
+        if call is not None and not call.cancelled.is_set():
+            call.waiters += 1
+            singleflight_stats["shared"] += 1
+            return call, True
+        call = CompletionCall(model, messages).start()
+        inflight_requests[key] = call
+    
+    def forget(done):
+        with inflight_lock:
+            if inflight_requests.get(key) is call:
+                del inflight_requests[key]
+    
+    call.future.add_done_callback(forget)
+    return call, False
+
+def get_singleflight_stats():
+    """Return request deduplication counters and hit rate"""
+    with inflight_lock:
+        calls = singleflight_stats["calls"]
+        shared = singleflight_stats["shared"]
+    return {
+        "calls": calls,
+        "shared": shared,
+        "upstream": calls - shared,
+        "hit_rate": shared / calls if calls else 0.0,
+    }
+
+# === ADAPTIVE TIMEOUTS AND HEDGING ===
+LATENCY_BUCKETS = [0.25, 0.5, 0.75, 1, 1.5, 2, 3, 4, 6, 8, 12, 16, 24, 32, 48, 64]  # Upper bounds (s)
+LATENCY_MIN_SAMPLES = 20  # Samples needed before percentiles are trusted
+LATENCY_HISTORY = 2000  # Counts are halved past this so old sessions fade out
+MIN_TIMEOUT = 5  # Adaptive timeouts never go below this (s)
+TIMEOUT_MARGIN = 1.5  # Timeout = observed time-to-first-token p99 x margin
+
+def prompt_size_class(prompt_tokens):
+    """Bucket prompts by size, since latency grows with prompt length"""
+    if prompt_tokens < 1000:
+        return "small"
+    if prompt_tokens < 4000:
+        return "medium"
+    return "large"
+
+def load_latency_stats():
+    """Return per-model latency histograms, loading latency.json on first use"""
+    global latency_stats
+    if latency_stats is None:
+        try:
+            HOME_DIR = os.path.join(os.path.expanduser("~"), "Documents", "248Tech")
+            LATENCY_FILE = os.path.join(HOME_DIR, "Logs", "latency.json")
+            with open(LATENCY_FILE, "r") as f:
+                data = json.load(f)
+            latency_stats = {
+                key: hist for key, hist in data.items()
+                if len(hist.get("counts", [])) == len(LATENCY_BUCKETS) + 1
+            }
+        except (FileNotFoundError, json.JSONDecodeError, AttributeError):
+            latency_stats = {}
+    return latency_stats
+
+def save_latency_stats(stats):
+    """Persist latency histograms so timeouts adapt across sessions"""
+    try:
+        HOME_DIR = os.path.join(os.path.expanduser("~"), "Documents", "248Tech")
+        LATENCY_FILE = os.path.join(HOME_DIR, "Logs", "latency.json")
+        
+        with open(LATENCY_FILE, "w") as f:
+            json.dump(stats, f)
+    except Exception as e:
+        print_error_box(f"Error saving latency stats: {e}")
+
+def record_latency(model, prompt_tokens, seconds):
+    """Add one time to first token to the model's histogram for this prompt size"""
+    with latency_lock:
+        stats = load_latency_stats()
+        key = f"{model}:{prompt_size_class(prompt_tokens)}"
+        hist = stats.setdefault(key, {"counts": [0] * (len(LATENCY_BUCKETS) + 1), "count": 0})
+        hist["counts"][bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        hist["count"] += 1
+        if hist["count"] > LATENCY_HISTORY:
+            hist["counts"] = [n // 2 for n in hist["counts"]]
+            hist["count"] = sum(hist["counts"])
+        save_latency_stats(stats)
+
+def latency_percentile(model, prompt_tokens, pct):
+    """Observed latency percentile, or None with too few samples"""
+    with latency_lock:
+        hist = load_latency_stats().get(f"{model}:{prompt_size_class(prompt_tokens)}")
+        if not hist or hist["count"] < LATENCY_MIN_SAMPLES:
+            return None
+        target = pct / 100 * hist["count"]
+        cumulative = 0
+        lower = 0.0
+        for upper, count in zip(LATENCY_BUCKETS + [LATENCY_BUCKETS[-1] * 2], hist["counts"]):
+            if count and cumulative + count >= target:
+                # Interpolate within the bucket that holds the target rank
+                return lower + (upper - lower) * (target - cumulative) / count
+            cumulative += count
+            lower = upper
+    return LATENCY_BUCKETS[-1] * 2
+
+def adaptive_timeout(model, prompt_tokens):
+    """Longest wait for the first token or between chunks, from the observed p99
+    
+    Applies to stalls only; a reply that keeps streaming runs until API_TIMEOUT.
+    """
+    p99 = latency_percentile(model, prompt_tokens, 99)
+    if p99 is None:
+        return API_TIMEOUT
+    return min(API_TIMEOUT, max(MIN_TIMEOUT, p99 * TIMEOUT_MARGIN))
+
+def hedge_allowed(model, prompt_tokens, usage):
+    """Check the hedge rate limit and that a duplicate request fits in the budget"""
+    worst_case = estimate_cost(model, prompt_tokens, 1000)
+    with hedge_lock:
+        if hedge_stats["hedged"] + 1 > HEDGE_MAX_FRACTION * hedge_stats["requests"]:
+            return False
+    return usage["total"] + worst_case < MAX_YEARLY_COST
+
+def request_completion(model, messages, usage, cancel=None):
+    """Run a completion with an adaptive stall timeout and optional hedging
+    
+    Returns (result, shared) for the first call to succeed; calls that lose,
+    time out or are cancelled through the cancel Event are stopped and billed
+    for what they consumed. Raises TimeoutError (GenerationTimeout when the
+    reply was still streaming at API_TIMEOUT), RequestCancelled or the API
+    error.
+    """
+    prompt_tokens = estimate_tokens("".join(m["content"] for m in messages))
+    timeout = adaptive_timeout(model, prompt_tokens)
+    
+    primary, shared = submit_completion(model, messages)
+    calls = [primary]
+    hedge_delay = None
+    if not shared:
+        with hedge_lock:
+            hedge_stats["requests"] += 1
+        hedge_delay = latency_percentile(model, prompt_tokens, 95) if HEDGE_REQUESTS else None
+        if hedge_delay and hedge_delay >= timeout:
+            hedge_delay = None
+    
+    # Timeouts and the hedge delay run from when each call starts upstream, not from
+    # submission; a call times out when it stalls or overruns API_TIMEOUT in total
+    winner = None
+    error = None
+    overran = False
+    pending = {primary.future}
+    while pending and winner is None:
+        if cancel and cancel.is_set():
+            break
+        now = time.perf_counter()
+        running = [call for call in calls if call.future in pending]
+        if all(call.stalled(timeout, now) or call.overran(now) for call in running):
+            overran = any(not call.stalled(timeout, now) for call in running)
+            break
+        if hedge_delay and len(calls) == 1 and primary.first_token is None and primary.stalled(hedge_delay, now):
+            hedge_delay = None
+            if hedge_allowed(model, prompt_tokens, usage):
+                with hedge_lock:
+                    hedge_stats["hedged"] += 1
+                calls.append(CompletionCall(model, messages).start())
+                pending.add(calls[-1].future)
+        done, pending = wait(pending, timeout=WATCHDOG_INTERVAL, return_when=FIRST_COMPLETED)
+        for call in calls:
+            if call.future in done:
+                if call.future.exception() is None and winner is None:
+                    winner = call
+                elif error is None:
+                    error = call.future.exception()
+    
+    # Stop waiting on every call (one nobody else waits on is cancelled) and bill those we own
+    for call in calls:
+        call.release()
+    stopped = [call for call in calls if call is not winner and not (call is primary and shared)]
+    for call in stopped:
+        bill_when_done(call, usage)
+    
+    if winner is None and cancel and cancel.is_set():
+        # Closing the stream ends generation at once; wait for it so the partial spend is recorded
+        done, _ = wait([call.future for call in stopped], timeout=CANCEL_GRACE)
+        partial = sum(call.future.result()["completion_tokens"] for call in stopped
+                      if call.future in done and call.future.exception() is None)
+        raise RequestCancelled(f"Request cancelled after {partial} completion tokens")
+    
+    if winner is None:
+        if error is not None and not pending:
+            raise error
+        if overran:
+            raise GenerationTimeout(f"API reply still streaming after {API_TIMEOUT:.0f} seconds")
+        if not shared and primary.first_token is None:
+            record_latency(model, prompt_tokens, timeout)
+        raise TimeoutError(f"API request timed out after {timeout:.0f} seconds without progress")
+    
+    result = winner.future.result()
+    if not shared:
+        record_latency(model, prompt_tokens, result["first_token"] or result["latency"])
+    if winner is not primary:
+        with hedge_lock:
+            hedge_stats["wins"] += 1
+    return result, shared
+
+class GenerationTimeout(TimeoutError):
+    """A reply was still streaming when API_TIMEOUT ran out; the API itself is fine"""
+
+def get_hedge_stats():
+    """Return hedging counters"""
+    with hedge_lock:
+        return dict(hedge_stats)
+
+# === CIRCUIT BREAKER ===
+def is_outage_error(error):
+    """True for errors that mean the API is unreachable, not that the request was bad"""
+    if isinstance(error, GenerationTimeout):
+        return False  # The stream was progressing; it was only too long
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    status = getattr(error, "status_code", None)
+    if status is not None:
+        return status >= 500
+    return type(error).__name__ in ("APIConnectionError", "APITimeoutError")
+
+def circuit_open():
+    """True while online requests should go straight to the local model"""
+    with breaker_lock:
+        return breaker_state["open"]
+
+def circuit_recovered():
+    """True once after the breaker closes again, so the UI can say so"""
+    with breaker_lock:
+        recovered = breaker_state["recovered"]
+        breaker_state["recovered"] = False
+    return recovered
+
+def record_online_success():
+    """Reset the failure count after a successful online request (closing the breaker if open)"""
+    with breaker_lock:
+        breaker_state["failures"] = 0
+        if breaker_state["open"]:
+            breaker_state.update(open=False, recovered=True)
+
+def record_online_failure(error, usage):
+    """Count an outage-type failure; at the threshold open the breaker and start probing"""
+    if not is_outage_error(error):
+        return
+    with breaker_lock:
+        breaker_state["failures"] += 1
+        if breaker_state["open"] or breaker_state["failures"] < BREAKER_THRESHOLD:
+            return
+        breaker_state["open"] = True
+        breaker_state["trips"] += 1
+        trip = breaker_state["trips"]
+    threading.Thread(target=probe_online_api, args=(trip, usage), daemon=True).start()
+
+def probe_online_api(trip, usage):
+    """Background probe that closes the breaker once chat completions work again
+    
+    Each probe is a one-token completion on PROBE_MODEL, billed like any other
+    request, so no user prompt has to wait out a hanging API to find out.
+    """
+    while is_running:
+        time.sleep(BREAKER_PROBE_INTERVAL)
+        with breaker_lock:
+            if not breaker_state["open"] or breaker_state["trips"] != trip:
+                return  # Closed by a successful request, or a newer probe took over
+        if usage["total"] >= MAX_YEARLY_COST:
+            return  # Online requests are refused at the cap anyway
+        try:
+            response = client.chat.completions.create(
+                model=PROBE_MODEL,
+                messages=[{"role": "user", "content": "ping"}],
+                max_tokens=1,
+                timeout=MIN_TIMEOUT,
+            )
+        except Exception:
+            continue
+        usage_data = getattr(response, "usage", None)
+        if usage_data:
+            record_usage(PROBE_MODEL, {"prompt_tokens": usage_data.prompt_tokens,
+                                       "completion_tokens": usage_data.completion_tokens}, usage)
+        else:
+            record_usage(PROBE_MODEL, {"prompt_tokens": estimate_tokens("ping"), "completion_tokens": 1}, usage)
+        with breaker_lock:
+            breaker_state.update(open=False, failures=0, recovered=True)
+        return
+
+# === METRICS ===
+def record_request_metrics(model, outcome, latency=None):
+    """Count a request by model and outcome (ok/error/timeout/cancelled) and its latency"""
+    with metrics_lock:
+        key = (model, outcome)
+        metrics["requests"][key] = metrics["requests"].get(key, 0) + 1
+        if latency is not None:
+            hist = metrics["latency"].setdefault(model, {"counts": [0] * (len(LATENCY_BUCKETS) + 1), "sum": 0.0})
+            hist["counts"][bisect.bisect_left(LATENCY_BUCKETS, latency)] += 1
+            hist["sum"] += latency
+
+def record_token_metrics(model, input_t, output_t, cost, cached_t=0):
+    """Count billed tokens and cost by model"""
+    with metrics_lock:
+        for kind, tokens in (("input", input_t), ("output", output_t), ("cached", cached_t)):
+            metrics["tokens"][(model, kind)] = metrics["tokens"].get((model, kind), 0) + tokens
+        metrics["cost"][model] = metrics["cost"].get(model, 0.0) + cost
+
+def label_value(value):
+    """Escape a Prometheus label value"""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def render_metrics():
+    """Render all counters in the Prometheus text exposition format"""
+    lines = []
+    
+    def metric(name, kind, help_text, samples):
+        lines.append(f"# HELP ai_assistant_{name} {help_text}")
+        lines.append(f"# TYPE ai_assistant_{name} {kind}")
+        for labels, value in samples:
+            label_text = ",".join(f'{key}="{label_value(val)}"' for key, val in labels)
+            lines.append(f"ai_assistant_{name}{{{label_text}}} {value}" if label_text else f"ai_assistant_{name} {value}")
+    
+    with metrics_lock:
+        requests = dict(metrics["requests"])
+        tokens = dict(metrics["tokens"])
+        costs = dict(metrics["cost"])
+        latency = {model: {"counts": list(h["counts"]), "sum": h["sum"]} for model, h in metrics["latency"].items()}
+    
+    metric("requests_total", "counter", "Requests by model and outcome",
+           [((("model", m), ("outcome", o)), n) for (m, o), n in sorted(requests.items())])
+    
+    lines.append("# HELP ai_assistant_request_latency_seconds Request latency by model")
+    lines.append("# TYPE ai_assistant_request_latency_seconds histogram")
+    for model, hist in sorted(latency.items()):
+        model = label_value(model)
+        cumulative = 0
+        for bound, count in zip(LATENCY_BUCKETS + ["+Inf"], hist["counts"]):
+            cumulative += count
+            lines.append(f'ai_assistant_request_latency_seconds_bucket{{model="{model}",le="{bound}"}} {cumulative}')
+        lines.append(f'ai_assistant_request_latency_seconds_sum{{model="{model}"}} {hist["sum"]:.6f}')
+        lines.append(f'ai_assistant_request_latency_seconds_count{{model="{model}"}} {cumulative}')
+    
+    metric("tokens_total", "counter", "Billed tokens by model and kind",
+           [((("model", m), ("kind", k)), n) for (m, k), n in sorted(tokens.items())])
+    metric("cost_dollars_total", "counter", "Estimated spend by model this session",
+           [((("model", m),), f"{c:.6f}") for m, c in sorted(costs.items())])
+    cache_ratios = []
+    for (m, k), n in sorted(tokens.items()):
+        if k == "input" and n:
+            cache_ratios.append(((("model", m),), f"{tokens.get((m, 'cached'), 0) / n:.4f}"))
+    metric("prompt_cache_hit_ratio", "gauge", "Share of input tokens served from the provider prompt cache", cache_ratios)
+    
+    dedup = get_singleflight_stats()
+    metric("dedup_requests_total", "counter", "Online requests seen by the deduplication layer", [((), dedup["calls"])])
+    metric("dedup_shared_total", "counter", "Requests that shared an identical in-flight call", [((), dedup["shared"])])
+    metric("dedup_hit_ratio", "gauge", "Share of requests served by an in-flight call", [((), f"{dedup['hit_rate']:.4f}")])
+    
+    hedges = get_hedge_stats()
+    metric("hedged_requests_total", "counter", "Requests that sent a hedge", [((), hedges["hedged"])])
+    metric("hedge_wins_total", "counter", "Hedges that answered first", [((), hedges["wins"])])
+    
+    with breaker_lock:
+        breaker = dict(breaker_state)
+    metric("circuit_open", "gauge", "1 while online requests fall back to the local model", [((), int(breaker["open"]))])
+    metric("circuit_trips_total", "counter", "Times the circuit breaker opened", [((), breaker["trips"])])
+    
+    # Budget is yearly and shared by all models; remaining requests use each model's average cost
+    spent = load_usage()["total"]
+    remaining = max(0.0, MAX_YEARLY_COST - spent)
+    metric("budget_dollars", "gauge", "Yearly budget", [((), f"{MAX_YEARLY_COST:.2f}")])
+    metric("budget_spent_dollars", "gauge", "Spend recorded in usage.json", [((), f"{spent:.6f}")])
+    metric("budget_remaining_dollars", "gauge", "Budget left", [((), f"{remaining:.6f}")])
+    estimates = []
+    for model, cost in sorted(costs.items()):
+        count = requests.get((model, "ok"), 0)
+        if count and cost > 0:
+            estimates.append(((("model", model),), int(remaining / (cost / count))))
+    metric("budget_remaining_requests", "gauge", "Requests left at this session's average cost per model", estimates)
+    
+    return "\n".join(lines) + "\n"
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    """Serve /metrics for Prometheus scrapes"""
+    
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        data = render_metrics().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+    
+    def log_message(self, format, *args):
+        pass  # Scrapes would clutter the terminal
+
+def write_metrics_textfile():
+    """Rewrite METRICS_TEXTFILE periodically (atomically, for textfile collectors)"""
+    while is_running:
+        try:
+            tmp_file = METRICS_TEXTFILE + ".tmp"
+            with open(tmp_file, "w", encoding="utf-8") as f:
+                f.write(render_metrics())
+            os.replace(tmp_file, METRICS_TEXTFILE)
+        except Exception:
+            pass  # Try again next interval
+        time.sleep(METRICS_INTERVAL)
+
+def start_metrics_export():
+    """Start the configured metrics endpoint and/or textfile writer"""
+    if METRICS_PORT:
+        try:
+            server = ThreadingHTTPServer(("127.0.0.1", METRICS_PORT), MetricsHandler)
+            server.daemon_threads = True
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+        except OSError as e:
+            print_error_box(f"Could not start metrics endpoint on port {METRICS_PORT}: {e}")
+    if METRICS_TEXTFILE:
+        threading.Thread(target=write_metrics_textfile, daemon=True).start()
+
 # === LOCAL LLM FUNCTION ===
 def generate_local_response(prompt):
     """Generate a response using local logic instead of API calls"""
@@ -627,6 +1536,183 @@ def generate_local_response(prompt):
         else:
             return random.choice(LOCAL_RESPONSES["general"]) + " " + random.choice(LOCAL_RESPONSES["thinking"])
 
+# === LOCAL WORKER POOL ===
+def load_local_backend():
+    """Load the offline backend from LOCAL_BACKEND, or the built-in responder"""
+    if not LOCAL_BACKEND:
+        return generate_local_response
+    module_name, _, factory_name = LOCAL_BACKEND.partition(":")
+    module = importlib.import_module(module_name)
+    return getattr(module, factory_name or "load")()
+
+def get_local_backend():
+    """Return the in-process offline backend, loading it once"""
+    global local_backend
+    if local_backend is None:
+        local_backend = load_local_backend()
+    return local_backend
+
+def local_worker_main(conn):
+    """Worker process: load the backend once, then answer prompts sent over the pipe"""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # The parent handles Ctrl+C
+    random.seed()  # Forked workers would otherwise share one random sequence
+    backend = load_local_backend()
+    while True:
+        try:
+            data = conn.recv_bytes()
+        except EOFError:
+            break
+        if not data:
+            break
+        # Prompts and replies travel as raw UTF-8 bytes, status-prefixed, never pickled
+        try:
+            reply = backend(data.decode("utf-8"))
+            conn.send_bytes(b"+" + reply.encode("utf-8"))
+        except Exception as e:
+            conn.send_bytes(b"-" + f"{type(e).__name__}: {e}".encode("utf-8"))
+    conn.close()
+
+class LocalWorkerPool:
+    """Warm offline-model worker processes, one request at a time each"""
+    
+    def __init__(self, size):
+        self.size = size
+        self.lock = threading.Lock()
+        self.workers = []
+        self.idle = queue.Queue()
+        for _ in range(size):
+            self.idle.put(self._spawn())
+    
+    def _spawn(self):
+        parent_conn, child_conn = multiprocessing.Pipe()
+        process = multiprocessing.Process(target=local_worker_main, args=(child_conn,), daemon=True)
+        process.start()
+        child_conn.close()
+        worker = (process, parent_conn)
+        with self.lock:
+            self.workers.append(worker)
+        return worker
+    
+    def generate(self, prompt):
+        """Run one prompt on an idle worker, blocking while all are busy"""
+        worker = self.idle.get()
+        process, conn = worker
+        try:
+            conn.send_bytes(prompt.encode("utf-8"))
+            data = conn.recv_bytes()
+        except (EOFError, OSError):
+            # Replace the dead worker so the pool keeps its size
+            with self.lock:
+                self.workers.remove(worker)
+            conn.close()
+            self.idle.put(self._spawn())
+            raise RuntimeError("Local worker process exited unexpectedly")
+        self.idle.put(worker)
+        if data[:1] == b"-":
+            raise RuntimeError(data[1:].decode("utf-8"))
+        return data[1:].decode("utf-8")
+    
+    def map(self, prompts):
+        """Generate replies for many prompts in parallel, preserving order"""
+        with ThreadPoolExecutor(max_workers=self.size) as dispatcher:
+            return list(dispatcher.map(self.generate, prompts))
+    
+    def shutdown(self):
+        """Ask every worker to exit and wait briefly for them"""
+        with self.lock:
+            workers = list(self.workers)
+            self.workers = []
+        for process, conn in workers:
+            try:
+                conn.send_bytes(b"")
+            except OSError:
+                pass
+            conn.close()
+        for process, conn in workers:
+            process.join(timeout=2)
+            if process.is_alive():
+                process.terminate()
+
+def get_local_pool():
+    """Return the shared offline worker pool, starting it on first use"""
+    global local_pool
+    with local_pool_lock:
+        if local_pool is None:
+            local_pool = LocalWorkerPool(LOCAL_WORKERS or os.cpu_count() or 1)
+        return local_pool
+
+def shutdown_local_pool():
+    """Stop the offline worker pool if it was started"""
+    global local_pool
+    with local_pool_lock:
+        pool, local_pool = local_pool, None
+    if pool:
+        pool.shutdown()
+
+def generate_local(prompt):
+    """Generate an offline reply"""
+    started = time.perf_counter()
+    if LOCAL_WORKERS > 0:
+        # Generate in a warm worker process so CPU-bound backends escape the GIL
+        reply = get_local_pool().generate(prompt)
+    else:
+        if not LOCAL_BACKEND:
+            # Simulate processing time for the built-in responder
+            time.sleep(1.5)
+        reply = get_local_backend()(prompt)
+    record_request_metrics("local-llm", "ok", time.perf_counter() - started)
+    return reply
+
+def complete_local(prompt):
+    """Generate an offline reply and log the exchange"""
+    reply = generate_local(prompt)
+    append_to_log(prompt, reply)  # Save original response to log
+    return reply
+
+def call_online(model, messages, usage, cancel=None):
+    """Run an online request through the shared engine and bill it
+    
+    Feeds the circuit breaker and metrics. Returns (reply, cost, shared,
+    result). Raises TimeoutError, RequestCancelled (once cancel is set) or
+    the API error.
+    """
+    # Make API call with an adaptive timeout (identical in-flight requests share one call)
+    started = time.perf_counter()
+    try:
+        result, shared = request_completion(model, messages, usage, cancel)
+    except RequestCancelled:
+        record_request_metrics(model, "cancelled")
+        raise
+    except Exception as e:
+        record_online_failure(e, usage)
+        record_request_metrics(model, "timeout" if isinstance(e, TimeoutError) else "error")
+        raise
+    record_online_success()
+    record_request_metrics(model, "ok", time.perf_counter() - started)
+    reply = result["content"].strip()
+
+    # Handle usage tracking (a shared call is billed to the request that made it)
+    cost = 0 if shared else record_usage(model, result, usage)
+    return reply, cost, shared, result
+
+def complete_gpt(prompt, model, usage, cancel=None):
+    """Get a reply from an online model, record its usage and log the exchange
+    
+    Returns (reply, cost, shared, result). Raises TimeoutError,
+    RequestCancelled (once cancel is set) or the API error.
+    """
+    # Preamble, summary of older exchanges, then recent history (a cacheable prefix)
+    messages = build_messages(prompt)
+    try:
+        reply, cost, shared, result = call_online(model, messages, usage, cancel)
+    except Exception:
+        schedule_summary_update(usage)  # Fold an oversized history before the next attempt
+        raise
+
+    append_to_log(prompt, reply)  # Save original response to log
+    schedule_summary_update(usage)
+    return reply, cost, shared, result
+
 def ask_local_llm(prompt, model, usage=None):
     """Send request to local LLM with simulated processing"""
     model_icon = "[*]"
@@ -643,11 +1729,7 @@ def ask_local_llm(prompt, model, usage=None):
         print(f"╰{'─' * (len('[>] Your prompt') + 4)}╯")
 
     try:
-        # Simulate processing time
-        time.sleep(1.5)
-        
-        # Generate response using local logic
-        reply = generate_local_response(prompt)
+        reply = complete_local(prompt)
         
         # Convert LaTeX to ASCII before displaying
         clean_reply = convert_latex_to_ascii(reply)
@@ -655,9 +1737,6 @@ def ask_local_llm(prompt, model, usage=None):
         # Apply word wrapping to the response
         wrapped_reply = wrap_output(clean_reply, WRAP_WIDTH, WRAP_INDENT)
         
-        # Save to log and copy to clipboard
-        append_to_log(prompt, reply)  # Save original response to log
-        
         # Display response
         print_response_box("[+] Response", wrapped_reply, BRIGHT_GREEN if ANSI_ENABLED else "")
         
@@ -665,14 +1744,14 @@ def ask_local_llm(prompt, model, usage=None):
         print_cost_summary(0, 0, model)
         
         # Copy to clipboard
-        pyperclip.copy(clean_reply)  # Copy cleaned response to clipboard
+        copy_to_clipboard(clean_reply)  # Copy cleaned response to clipboard
         print_info_box("[*] Status", "Copied to clipboard", BRIGHT_MAGENTA if ANSI_ENABLED else "")
 
     except Exception as e:
         print_error_box(f"Local LLM Error: {e}")
 
 def ask_gpt(prompt, model, usage):
-    """Send request to GPT with timeout and error handling"""
+    """Send request to GPT with timeout and error handling; returns True on success"""
     model_icon = "[*]" if model == "gpt-4o" else "[+]"
     print_info_box(f"{model_icon} AI Assistant", f"Model: {model.upper()} • Processing your request...", BRIGHT_CYAN if ANSI_ENABLED else "")
     print_input_box("[>] Your prompt")
@@ -686,35 +1765,10 @@ def ask_gpt(prompt, model, usage):
     else:
         print(f"╰{'─' * (len('[>] Your prompt') + 4)}╯")
 
+    # Ctrl+C now cancels this request instead of exiting (see signal_handler)
+    cancel = begin_foreground_request()
     try:
-        # Load context asynchronously
-        context = load_context()
-        full_prompt = f"{context}\nYou: {prompt}" if context else prompt
-
-        # Make API call with timeout
-        API_TIMEOUT = 30
-        future = executor.submit(
-            client.chat.completions.create,
-            model=model,
-            messages=[{"role": "user", "content": full_prompt}]
-        )
-        
-        response = future.result(timeout=API_TIMEOUT)
-        reply = response.choices[0].message.content.strip()
-
-        # Handle usage tracking
-        usage_data = getattr(response, "usage", None)
-        if usage_data:
-            input_t = usage_data.prompt_tokens
-            output_t = usage_data.completion_tokens
-            cost = estimate_cost(model, input_t, output_t)
-
-            usage["input"] += input_t
-            usage["output"] += output_t
-            usage["total"] += cost
-            save_usage(usage)
-        else:
-            cost = 0
+        reply, cost, shared, result = complete_gpt(prompt, model, usage, cancel)
 
         # Convert LaTeX to ASCII before displaying
         clean_reply = convert_latex_to_ascii(reply)
@@ -722,23 +1776,173 @@ def ask_gpt(prompt, model, usage):
         # Apply word wrapping to the response
         wrapped_reply = wrap_output(clean_reply, WRAP_WIDTH, WRAP_INDENT)
         
-        # Save to log and copy to clipboard
-        append_to_log(prompt, reply)  # Save original response to log
-        
         # Display response
         print_response_box("[+] Response", wrapped_reply, BRIGHT_GREEN if ANSI_ENABLED else "")
         
-        # Display cost summary
-        print_cost_summary(cost, usage["total"], model)
+        # Display cost summary, with the share of this request's input served from the prompt cache
+        cache_ratio = None
+        if not shared and not result["estimated"] and result["prompt_tokens"]:
+            cache_ratio = result["cached_tokens"] / result["prompt_tokens"]
+        print_cost_summary(cost, usage["total"], model, cache_ratio)
+        if shared:
+            print_info_box("[*] Status", "Shared an identical in-flight request • no extra cost", BRIGHT_MAGENTA if ANSI_ENABLED else "")
         
         # Copy to clipboard
-        pyperclip.copy(clean_reply)  # Copy cleaned response to clipboard
+        copy_to_clipboard(clean_reply)  # Copy cleaned response to clipboard
         print_info_box("[*] Status", "Copied to clipboard", BRIGHT_MAGENTA if ANSI_ENABLED else "")
+        return True
 
-    except TimeoutError:
-        print_error_box(f"API request timed out after {API_TIMEOUT} seconds")
+    except RequestCancelled as e:
+        print_info_box("[i] Info", f"{e} • partial usage billed", BRIGHT_YELLOW if ANSI_ENABLED else "")
+    except TimeoutError as e:
+        print_error_box(str(e))
     except Exception as e:
         print_error_box(f"API Error: {e}")
+    finally:
+        end_foreground_request()
+    return False
+
+# === MULTI-MODEL FAN-OUT ===
+FANOUT_MODES = ("race", "compare")
+
+def fanout_models():
+    """Configured fan-out models usable in this session"""
+    return [model for model in FANOUT_MODELS if model == "local-llm" or (HAS_API_KEY and model in ONLINE_MODELS)]
+
+def run_branch(model, prompt, messages, usage, cancel):
+    """Answer one fan-out branch; returns a dict with the reply or the error"""
+    branch = {"model": model, "reply": None, "error": None, "cost": 0.0, "tokens": 0, "shared": False}
+    started = time.perf_counter()
+    try:
+        if model == "local-llm":
+            branch["reply"] = generate_local(prompt)
+            branch["tokens"] = estimate_tokens(branch["reply"])
+        elif circuit_open():
+            branch["error"] = "Online API unavailable"
+        else:
+            reply, cost, shared, result = call_online(model, messages, usage, cancel)
+            branch.update(reply=reply, cost=cost, shared=shared,
+                          tokens=result["prompt_tokens"] + result["completion_tokens"])
+    except RequestCancelled:
+        branch["error"] = "Cancelled"
+    except Exception as e:
+        branch["error"] = str(e) or type(e).__name__
+    branch["latency"] = time.perf_counter() - started
+    return branch
+
+def fan_out(prompt, mode, usage):
+    """Send one prompt to every fan-out model at once
+    
+    In race mode the first reply is shown and the other branches are
+    cancelled (and billed for what they used). In compare mode every reply is
+    shown with its latency, tokens and cost. Returns the branch results.
+    """
+    messages = build_messages(prompt)
+    prompt_tokens = estimate_tokens("".join(m["content"] for m in messages))
+    
+    # Each online branch must fit in the budget next to the ones already started
+    launched = []
+    reserved = 0.0
+    for model in fanout_models():
+        if model != "local-llm":
+            worst_case = estimate_cost(model, prompt_tokens, 1000)
+            if usage["total"] + reserved + worst_case >= MAX_YEARLY_COST:
+                print_info_box("[!] Budget", f"Skipping {model.upper()} • it could exceed the ${MAX_YEARLY_COST:.2f} cap", BRIGHT_YELLOW if ANSI_ENABLED else "")
+                continue
+            reserved += worst_case
+        launched.append(model)
+    if not launched:
+        print_error_box("No fan-out model can run within the budget.")
+        return []
+    
+    cancels = {model: threading.Event() for model in launched}
+    foreground = begin_foreground_request()
+    pool = ThreadPoolExecutor(max_workers=len(launched))
+    try:
+        futures = {pool.submit(run_branch, model, prompt, messages, usage, cancels[model]): model for model in launched}
+        pending = set(futures)
+        branches = {}
+        while pending:
+            done, pending = wait_or_cancel(pending, CANCEL_POLL_INTERVAL, foreground)
+            for future in done:
+                branches[futures[future]] = future.result()
+            if foreground.is_set():
+                break
+            if mode == "race" and any(b["reply"] is not None for b in branches.values()):
+                break
+        
+        # Stop whatever is still running; cancelled online branches bill their partial usage
+        for model in launched:
+            if model not in branches:
+                cancels[model].set()
+        if foreground.is_set():
+            done, _ = wait(pending, timeout=CANCEL_GRACE + 1)
+            for future in done:
+                branches[futures[future]] = future.result()
+            raise RequestCancelled("Request cancelled")
+    finally:
+        pool.shutdown(wait=False)
+        end_foreground_request()
+    
+    return [branches[model] for model in launched if model in branches]
+
+def ask_fanout(prompt, mode, usage):
+    """Race or compare the fan-out models on one prompt and display the result"""
+    models = " • ".join(model.upper() for model in fanout_models())
+    title = "[*] Race" if mode == "race" else "[*] Compare"
+    print_info_box(title, f"Models: {models} • Processing your request...", BRIGHT_CYAN if ANSI_ENABLED else "")
+    print_input_box("[>] Your prompt")
+    
+    # Apply word wrapping to the prompt
+    wrapped_prompt = wrap_output(prompt, WRAP_WIDTH, WRAP_INDENT)
+    print(f"{wrapped_prompt}")
+    
+    if ANSI_ENABLED:
+        print(f"{BRIGHT_BLUE}╰{'─' * (len('[>] Your prompt') + 4)}╯{RESET}")
+    else:
+        print(f"╰{'─' * (len('[>] Your prompt') + 4)}╯")
+    
+    try:
+        branches = fan_out(prompt, mode, usage)
+        
+        answered = [b for b in branches if b["reply"] is not None]
+        if mode == "race":
+            # Branches were recorded as they finished, so the first answer is the winner
+            shown = answered[:1]
+        else:
+            shown = branches
+        for branch in shown:
+            label = f"[+] {branch['model'].upper()} • {branch['latency']:.2f}s"
+            if branch["reply"] is None:
+                print_error_box(f"{branch['model'].upper()}: {branch['error']}")
+                continue
+            cost = "shared" if branch["shared"] else f"${branch['cost']:.6f}"
+            wrapped_reply = wrap_output(convert_latex_to_ascii(branch["reply"]), WRAP_WIDTH, WRAP_INDENT)
+            print_response_box(f"{label} • {branch['tokens']} tokens • {cost}", wrapped_reply, BRIGHT_GREEN if ANSI_ENABLED else "")
+        
+        if not answered:
+            errors = "; ".join(f"{b['model'].upper()}: {b['error']}" for b in branches)
+            if mode == "race":
+                print_error_box(f"No model answered. {errors}")
+            schedule_summary_update(usage)  # Fold an oversized history before the next attempt
+            return
+        
+        # The race winner, or in compare mode the first listed model to answer, continues the conversation
+        chosen = answered[0]
+        if mode == "race":
+            print_info_box("[*] Status", f"{chosen['model'].upper()} answered first • slower branches cancelled", BRIGHT_MAGENTA if ANSI_ENABLED else "")
+        print_cost_summary(sum(b["cost"] for b in branches), usage["total"], mode)
+        append_to_log(prompt, chosen["reply"])
+        schedule_summary_update(usage)
+        
+        # Copy to clipboard
+        copy_to_clipboard(convert_latex_to_ascii(chosen["reply"]))
+        print_info_box("[*] Status", f"Copied {chosen['model'].upper()} response to clipboard", BRIGHT_MAGENTA if ANSI_ENABLED else "")
+    
+    except RequestCancelled as e:
+        print_info_box("[i] Info", f"{e} • partial usage billed", BRIGHT_YELLOW if ANSI_ENABLED else "")
+    except Exception as e:
+        print_error_box(f"Fan-out Error: {e}")
 
 # === MODEL SELECTION ===
 def select_model():
@@ -754,6 +1958,11 @@ def select_model():
         options.append("1. GPT-3.5 Turbo (Online)")
         options.append("2. GPT-4o (Online)")
     options.append("3. Local LLM (Offline)")
+    fanout = len(fanout_models()) > 1
+    if fanout:
+        options.append("4. Race models (first answer wins)")
+        options.append("5. Compare models (side by side)")
+    last_choice = 5 if fanout else 3
     
     print("\nAvailable models:")
     for option in options:
@@ -761,7 +1970,7 @@ def select_model():
     
     # Get user choice
     while True:
-        choice = get_user_input("[*] Enter your choice (1-3)")
+        choice = get_user_input(f"[*] Enter your choice (1-{last_choice})")
         if not choice:
             print_info_box("[i] Info", "Cancelled by user.", BRIGHT_YELLOW if ANSI_ENABLED else "")
             return False
@@ -780,10 +1989,15 @@ def select_model():
                 selected_model = "local-llm"
                 print_info_box("[i] Info", f"Selected model: {selected_model.upper()} (OFFLINE)", BRIGHT_GREEN if ANSI_ENABLED else "")
                 return True
+            elif choice_num in (4, 5) and fanout:
+                selected_model = FANOUT_MODES[choice_num - 4]
+                models = " • ".join(model.upper() for model in fanout_models())
+                print_info_box("[i] Info", f"Selected mode: {selected_model.upper()} • {models}", BRIGHT_GREEN if ANSI_ENABLED else "")
+                return True
             else:
-                print_error_box("Invalid choice. Please enter 1, 2, or 3.")
+                print_error_box(f"Invalid choice. Please enter a number from 1 to {last_choice}.")
         except ValueError:
-            print_error_box("Please enter a valid number (1, 2, or 3).")
+            print_error_box(f"Please enter a valid number (1-{last_choice}).")
 
 def get_user_input(prompt_text, timeout=30):
     """Get user input with proper text input including spaces"""
@@ -824,6 +2038,27 @@ def get_user_input(prompt_text, timeout=30):
             print(f"╰{'─' * (len(prompt_text) + 4)}╯")
         return None
 
+def handle_prompt(prompt, model, usage):
+    """Send a prompt to the selected model, or the local one while the API is down"""
+    if model in FANOUT_MODES:
+        # Each branch checks the breaker and budget itself
+        ask_fanout(prompt, model, usage)
+        return
+    
+    if model != "local-llm":
+        if circuit_recovered():
+            print_info_box("[i] Info", "Online API reachable again", BRIGHT_GREEN if ANSI_ENABLED else "")
+        if circuit_open():
+            print_info_box("[!] Offline Fallback", "Online API unavailable • answering with the local model", BRIGHT_YELLOW if ANSI_ENABLED else "")
+            model = "local-llm"
+    
+    if model == "local-llm":
+        ask_local_llm(prompt, model)
+    elif not ask_gpt(prompt, model, usage) and circuit_open():
+        # This failure tripped the breaker; answer it locally too
+        print_info_box("[!] Offline Fallback", "Online API unavailable • answering with the local model", BRIGHT_YELLOW if ANSI_ENABLED else "")
+        ask_local_llm(prompt, "local-llm")
+
 def prompt_flow():
     """Handle the prompt flow with continuous input loop"""
     global selected_model
@@ -848,10 +2083,7 @@ def prompt_flow():
                 break
             
             # Process the request using the selected model
-            if selected_model == "local-llm":
-                ask_local_llm(user_prompt, selected_model)
-            else:
-                ask_gpt(user_prompt, selected_model, usage)
+            handle_prompt(user_prompt, selected_model, usage)
             
             # Show separator and prepare for next input
             print_separator()
@@ -861,20 +2093,450 @@ def prompt_flow():
     except Exception as e:
         print_error_box(f"Prompt Error: {e}")
 
+def watch_clipboard():
+    """Submit newly copied clipboard text as prompts until interrupted"""
+    global selected_model
+    
+    usage = load_usage() if selected_model != "local-llm" else None
+    
+    try:
+        seen_hash = clipboard_hash(pyperclip.paste() or "")
+    except Exception as e:
+        print_error_box(f"Clipboard unavailable: {e}")
+        return
+    
+    print_separator()
+    print_info_box("[*] Clipboard Watch", "Copy text to submit it as a prompt • Ctrl+C to stop", BRIGHT_CYAN if ANSI_ENABLED else "")
+    
+    interval = WATCH_MIN_INTERVAL
+    pending_hash = None
+    pending_since = 0.0
+    reply_hash = None  # Hash of the reply we last put on the clipboard
+    
+    while is_running:
+        time.sleep(interval)
+        try:
+            text = pyperclip.paste() or ""
+        except Exception as e:
+            print_error_box(f"Clipboard read failed: {e}")
+            interval = WATCH_MAX_INTERVAL
+            continue
+        
+        current = clipboard_hash(text)
+        now = time.monotonic()
+        
+        if current == pending_hash:
+            # Wait until the clipboard settles so rapid copies submit once
+            if now - pending_since < WATCH_DEBOUNCE:
+                continue
+            pending_hash = None
+            seen_hash = current
+            if not text.strip():
+                continue
+            
+            if selected_model != "local-llm" and usage["total"] >= MAX_YEARLY_COST:
+                print_error_box(f"Budget cap of ${MAX_YEARLY_COST:.2f} reached.")
+                return
+            
+            copied_before = last_copied_hash
+            handle_prompt(text.strip(), selected_model, usage)
+            print_separator()
+            
+            # The submitted text is seen whether or not it succeeded; a reply
+            # the request put on the clipboard must not be taken as input either
+            seen_hash = current
+            if last_copied_hash != copied_before:
+                reply_hash = last_copied_hash
+            interval = WATCH_MIN_INTERVAL
+        elif current == seen_hash or current == reply_hash:
+            # Idle: back off towards the slowest poll rate
+            pending_hash = None
+            seen_hash = current
+            interval = min(interval * 1.5, WATCH_MAX_INTERVAL)
+        else:
+            # New text: start (or restart) the debounce window and poll quickly
+            pending_hash = current
+            pending_since = now
+            interval = WATCH_MIN_INTERVAL
+
+def run_local_batch(path):
+    """Answer every prompt in a file (one per line) with the offline worker pool"""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            prompts = [line.strip() for line in f if line.strip()]
+    except OSError as e:
+        print_error_box(f"Could not read batch file: {e}")
+        return
+    
+    pool = get_local_pool()
+    print_info_box("[*] Batch", f"{len(prompts)} prompts • {pool.size} worker processes", BRIGHT_CYAN if ANSI_ENABLED else "")
+    
+    started = time.perf_counter()
+    try:
+        replies = pool.map(prompts)
+    except Exception as e:
+        print_error_box(f"Batch Error: {e}")
+        return
+    elapsed = time.perf_counter() - started
+    
+    for number, (prompt, reply) in enumerate(zip(prompts, replies), 1):
+        record_request_metrics("local-llm", "ok")
+        append_to_log(prompt, reply)
+        wrapped_reply = wrap_output(convert_latex_to_ascii(reply), WRAP_WIDTH, WRAP_INDENT)
+        print_response_box(f"[+] {number}. {prompt[:40]}", wrapped_reply, BRIGHT_GREEN if ANSI_ENABLED else "")
+    
+    rate = len(prompts) / elapsed if elapsed > 0 else 0.0
+    print_info_box("[*] Batch Complete", f"{len(prompts)} replies in {elapsed:.2f}s ({rate:.1f}/s)", BRIGHT_GREEN if ANSI_ENABLED else "")
+
+# === DOCUMENT MODE ===
+def iter_paragraphs(f, max_chars):
+    """Yield blank-line separated paragraphs, splitting any longer than max_chars"""
+    lines = []
+    for line in f:
+        if line.strip():
+            lines.append(line.rstrip("\n"))
+            continue
+        if lines:
+            yield from split_oversized("\n".join(lines), max_chars)
+            lines = []
+    if lines:
+        yield from split_oversized("\n".join(lines), max_chars)
+
+def split_oversized(text, max_chars):
+    """Split text at whitespace into pieces of at most max_chars"""
+    while len(text) > max_chars:
+        cut = text.rfind(" ", 0, max_chars)
+        if cut <= 0:
+            cut = max_chars
+        yield text[:cut]
+        text = text[cut:].lstrip()
+    if text:
+        yield text
+
+def read_document_chunks(path, max_tokens):
+    """Stream a text file into chunks of whole paragraphs, each within max_tokens"""
+    chunks = []
+    current = []
+    current_tokens = 0
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        for paragraph in iter_paragraphs(f, max_tokens * 4):
+            tokens = estimate_tokens(paragraph)
+            if current and current_tokens + tokens > max_tokens:
+                chunks.append("\n\n".join(current))
+                current, current_tokens = [], 0
+            current.append(paragraph)
+            current_tokens += tokens
+    if current:
+        chunks.append("\n\n".join(current))
+    return chunks
+
+def load_document_checkpoint(chunks, task, model):
+    """Return (path, state) of the checkpoint for this document, task and model"""
+    digest = hashlib.sha256()
+    for part in [task, model, str(DOCUMENT_CHUNK_TOKENS)] + chunks:
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    
+    HOME_DIR = os.path.join(os.path.expanduser("~"), "Documents", "248Tech")
+    CHECKPOINT_DIR = os.path.join(HOME_DIR, "Logs", "Documents")
+    os.makedirs(CHECKPOINT_DIR, exist_ok=True)
+    path = os.path.join(CHECKPOINT_DIR, f"{digest.hexdigest()[:16]}.json")
+    
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            state = json.load(f)
+        if isinstance(state.get("results"), dict):
+            return path, state
+    except (FileNotFoundError, json.JSONDecodeError, AttributeError):
+        pass
+    return path, {"task": task, "model": model, "chunks": len(chunks), "results": {}, "final": None}
+
+def save_document_checkpoint(path, state):
+    """Write a document checkpoint atomically"""
+    try:
+        tmp_file = path + ".tmp"
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            json.dump(state, f, ensure_ascii=False)
+        os.replace(tmp_file, path)
+    except Exception as e:
+        print_error_box(f"Error saving document checkpoint: {e}")
+
+def run_document_request(prompt, model, usage):
+    """One map or reduce request, retried on rate limits and outages within the budget"""
+    if model == "local-llm":
+        return get_local_pool().generate(prompt) if LOCAL_WORKERS > 0 else get_local_backend()(prompt)
+    
+    # Chunks run concurrently, so each reserves its worst case before starting
+    worst_case = estimate_cost(model, estimate_tokens(prompt), 1000)
+    for attempt in range(DOCUMENT_RETRIES + 1):
+        if circuit_open():
+            raise RuntimeError("Online API unavailable")
+        if not reserve_budget(usage, worst_case):
+            raise RuntimeError(f"Budget cap of ${MAX_YEARLY_COST:.2f} reached")
+        
+        started = time.perf_counter()
+        try:
+            result, shared = request_completion(model, [{"role": "user", "content": prompt}], usage)
+        except Exception as e:
+            release_budget(worst_case)
+            record_online_failure(e, usage)
+            record_request_metrics(model, "timeout" if isinstance(e, TimeoutError) else "error")
+            retryable = is_outage_error(e) or getattr(e, "status_code", None) == 429
+            if not retryable or attempt == DOCUMENT_RETRIES:
+                raise
+            time.sleep(2 ** attempt + random.random())  # Back off before retrying
+            continue
+        
+        record_online_success()
+        record_request_metrics(model, "ok", time.perf_counter() - started)
+        if not shared:
+            record_usage(model, result, usage)
+        release_budget(worst_case)
+        return result["content"].strip()
+
+def group_partials(partials, max_tokens):
+    """Group consecutive partial results for reduction, at least two per group"""
+    groups = []
+    current = []
+    current_tokens = 0
+    for text in partials:
+        tokens = estimate_tokens(text)
+        if len(current) >= 2 and current_tokens + tokens > max_tokens:
+            groups.append(current)
+            current, current_tokens = [], 0
+        current.append(text)
+        current_tokens += tokens
+    if len(current) == 1 and groups:
+        groups[-1].extend(current)
+    elif current:
+        groups.append(current)
+    return groups
+
+def reduce_partials(partials, task, model, usage):
+    """Merge partial results, in rounds when they don't fit in one request"""
+    def reduce_group(group):
+        parts = "\n\n".join(f"[Part {n}]\n{text}" for n, text in enumerate(group, 1))
+        prompt = (
+            f"{task}\n\nBelow are results for consecutive parts of one document, in order. "
+            f"Combine them into a single coherent result for the whole document.\n\n{parts}"
+        )
+        return run_document_request(prompt, model, usage)
+    
+    while len(partials) > 1:
+        groups = group_partials(partials, DOCUMENT_CHUNK_TOKENS)
+        print(f"{DIM}  Combining {len(partials)} partial results in {len(groups)} request(s)...{RESET}")
+        with ThreadPoolExecutor(max_workers=DOCUMENT_CONCURRENCY) as pool:
+            partials = list(pool.map(reduce_group, groups))
+    return partials[0]
+
+def process_document(path, task, model, usage):
+    """Map a task over a large document chunk by chunk, then reduce the results"""
+    try:
+        chunks = read_document_chunks(path, DOCUMENT_CHUNK_TOKENS)
+    except OSError as e:
+        print_error_box(f"Could not read document: {e}")
+        return
+    if not chunks:
+        print_error_box("Document is empty.")
+        return
+    
+    checkpoint_path, state = load_document_checkpoint(chunks, task, model)
+    start_total = usage["total"] if usage is not None else 0.0
+    results = state["results"]
+    todo = [i for i in range(len(chunks)) if str(i) not in results]
+    name = os.path.basename(path)
+    print_info_box("[*] Document", f"{name} • {len(chunks)} chunks ({len(chunks) - len(todo)} from checkpoint) • {model.upper()}", BRIGHT_CYAN if ANSI_ENABLED else "")
+    
+    progress_lock = threading.Lock()
+    failures = []
+    
+    def map_chunk(index):
+        prompt = (
+            f"{task}\n\nThis is part {index + 1} of {len(chunks)} of a longer document; "
+            f"work on this part only.\n\n{chunks[index]}"
+        )
+        try:
+            text = run_document_request(prompt, model, usage)
+        except Exception as e:
+            with progress_lock:
+                failures.append(index)
+                print(f"{BRIGHT_RED}  [x] Chunk {index + 1}/{len(chunks)} failed: {e}{RESET}")
+            return
+        with progress_lock:
+            results[str(index)] = text
+            save_document_checkpoint(checkpoint_path, state)
+            print(f"{DIM}  [{len(results)}/{len(chunks)}] Chunk {index + 1} done{RESET}")
+    
+    if state.get("final") is None:
+        with ThreadPoolExecutor(max_workers=DOCUMENT_CONCURRENCY) as pool:
+            list(pool.map(map_chunk, todo))
+        
+        if failures:
+            print_error_box(f"{len(failures)} of {len(chunks)} chunks failed • run the same command again to resume")
+            return
+        
+        try:
+            state["final"] = reduce_partials([results[str(i)] for i in range(len(chunks))], task, model, usage)
+        except Exception as e:
+            print_error_box(f"Combining results failed: {e} • run the same command again to resume")
+            return
+        save_document_checkpoint(checkpoint_path, state)
+    
+    final = state["final"]
+    append_to_log(f"[Document: {name}] {task}", final)
+    clean_final = convert_latex_to_ascii(final)
+    print_response_box("[+] Document Result", wrap_output(clean_final, WRAP_WIDTH, WRAP_INDENT), BRIGHT_GREEN if ANSI_ENABLED else "")
+    total = usage["total"] if usage is not None else 0.0
+    print_cost_summary(total - start_total, total, model)
+    try:
+        copy_to_clipboard(clean_final)
+    except Exception as e:
+        print_error_box(f"Clipboard unavailable: {e} • the result is saved in the chat log")
+        return
+    print_info_box("[*] Status", "Copied to clipboard", BRIGHT_MAGENTA if ANSI_ENABLED else "")
+
+# === DAEMON ===
+class DaemonHandler(socketserver.StreamRequestHandler):
+    """Serve one newline-delimited JSON request per connection"""
+    
+    def send_event(self, **event):
+        self.wfile.write((json.dumps(event) + "\n").encode("utf-8"))
+        self.wfile.flush()
+    
+    def handle(self):
+        try:
+            request = json.loads(self.rfile.readline() or b"{}")
+        except ValueError:
+            self.send_event(type="error", message="Request is not valid JSON")
+            return
+        
+        op = request.get("op", "ask")
+        try:
+            if op == "ask":
+                self.handle_ask(request)
+            elif op == "status":
+                with usage_lock:
+                    usage = dict(self.server.usage)
+                self.send_event(type="status", model=self.server.default_model, usage=usage,
+                                budget=MAX_YEARLY_COST, dedup=get_singleflight_stats())
+            elif op == "shutdown":
+                self.send_event(type="done")
+                threading.Thread(target=self.server.shutdown, daemon=True).start()
+            else:
+                self.send_event(type="error", message=f"Unknown op: {op}")
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # Client went away
+    
+    def handle_ask(self, request):
+        prompt = (request.get("prompt") or "").strip()
+        model = request.get("model") or self.server.default_model
+        usage = self.server.usage
+        if not prompt:
+            self.send_event(type="error", message="Empty prompt")
+            return
+        if model != "local-llm" and model not in ONLINE_MODELS:
+            # Unpriced models would be billed at $0 and slip past the budget cap
+            known = ", ".join(ONLINE_MODELS + ("local-llm",))
+            self.send_event(type="error", message=f"Unknown model: {model} (use one of {known})")
+            return
+        
+        try:
+            if model != "local-llm" and HAS_API_KEY and circuit_open():
+                model = "local-llm"  # Online API is down: answer offline
+            
+            if model == "local-llm":
+                reply, cost = complete_local(prompt), 0.0
+            elif not HAS_API_KEY:
+                self.send_event(type="error", message="Online models need an API key in config.py")
+                return
+            elif usage["total"] >= MAX_YEARLY_COST:
+                self.send_event(type="error", message=f"Budget cap of ${MAX_YEARLY_COST:.2f} reached.")
+                return
+            else:
+                try:
+                    reply, cost, shared, _ = complete_gpt(prompt, model, usage)
+                except Exception:
+                    if not circuit_open():
+                        raise
+                    model = "local-llm"
+                    reply, cost = complete_local(prompt), 0.0
+        except TimeoutError as e:
+            self.send_event(type="error", message=str(e))
+            return
+        except Exception as e:
+            self.send_event(type="error", message=f"{type(e).__name__}: {e}")
+            return
+        
+        self.send_event(type="delta", content=reply)
+        self.send_event(type="done", model=model, cost=cost, total=usage["total"] if usage else 0.0)
+
+def run_daemon():
+    """Keep the backend, usage and worker pools resident and serve DAEMON_SOCKET"""
+    if not hasattr(socketserver, "ThreadingUnixStreamServer"):
+        print_error_box("Daemon mode needs Unix domain sockets, which this platform does not provide.")
+        return
+    
+    path = DAEMON_SOCKET
+    if os.path.exists(path):
+        # A leftover socket file is only reused if nothing answers on it
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(path)
+            print_error_box(f"A daemon is already listening on {path}")
+            return
+        except OSError:
+            os.unlink(path)
+        finally:
+            probe.close()
+    
+    server = socketserver.ThreadingUnixStreamServer(path, DaemonHandler)
+    server.daemon_threads = True
+    server.default_model = DEFAULT_MODEL if HAS_API_KEY else "local-llm"
+    server.usage = load_usage()
+    os.chmod(path, 0o600)
+    
+    print_info_box("[*] Daemon", f"Listening on {path} • default model {server.default_model.upper()}", BRIGHT_CYAN if ANSI_ENABLED else "")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        if os.path.exists(path):
+            os.unlink(path)
+
 # === SIGNAL HANDLING ===
 def signal_handler(signum, frame):
-    """Handle shutdown signals gracefully"""
+    """Cancel the request in progress on the first Ctrl+C, otherwise shut down gracefully"""
     global is_running
+    if signum == signal.SIGINT and cancel_foreground_request():
+        if ANSI_ENABLED:
+            print(f"\n{BRIGHT_YELLOW}[!] Cancelling request... (Ctrl+C again to exit){RESET}")
+        else:
+            print(f"\n[!] Cancelling request... (Ctrl+C again to exit)")
+        return
     if ANSI_ENABLED:
         print(f"\n{BRIGHT_GREEN}[*] Shutting down gracefully...{RESET}")
     else:
         print(f"\n[*] Shutting down gracefully...")
     is_running = False
     executor.shutdown(wait=False)
+    summary_executor.shutdown(wait=False)
+    shutdown_local_pool()
     sys.exit(0)
 
 # === MAIN ===
+def parse_args():
+    """Parse command line options"""
+    parser = argparse.ArgumentParser(description="AI Typing Assistant")
+    parser.add_argument("--watch", action="store_true", help="submit copied clipboard text as prompts")
+    parser.add_argument("--batch", metavar="FILE", help="answer each line of FILE with the offline model and exit")
+    parser.add_argument("--daemon", action="store_true", help="stay resident and serve prompts on a Unix socket (see ai_client.py)")
+    parser.add_argument("--document", metavar="FILE", help="process a large text file chunk by chunk and exit")
+    parser.add_argument("--task", default=None, help="what to do with --document (asked for when omitted)")
+    return parser.parse_args()
+
 if __name__ == "__main__":
+    args = parse_args()
+    
     # Set up signal handlers
     signal.signal(signal.SIGINT, signal_handler)
     signal.signal(signal.SIGTERM, signal_handler)
@@ -883,6 +2545,26 @@ if __name__ == "__main__":
     if not ensure_dirs():
         print_error_box("Failed to initialize. Exiting.")
         sys.exit(1)
+    start_metrics_export()
+    
+    # Offline batch runs skip the interactive menu
+    if args.batch:
+        try:
+            run_local_batch(args.batch)
+        finally:
+            shutdown_local_pool()
+        sys.exit(0)
+    
+    # Daemon mode also skips the menu; requests choose their own model
+    if args.daemon:
+        try:
+            run_daemon()
+        finally:
+            is_running = False
+            executor.shutdown(wait=False)
+            summary_executor.shutdown(wait=True)
+            shutdown_local_pool()
+        sys.exit(0)
     
     # Display startup banner
     print_banner()
@@ -893,13 +2575,30 @@ if __name__ == "__main__":
         sys.exit(1)
     
     try:
-        # Start the prompt flow directly
-        prompt_flow()
+        # Start the prompt flow (or clipboard watch / document mode)
+        if args.document:
+            task = args.task or get_user_input("[>] What should be done with the document?") or "Summarize this document."
+            model = selected_model
+            if model in FANOUT_MODES:
+                # Chunks go to a single model; use the first one configured for fan-out
+                model = fanout_models()[0]
+                print_info_box("[i] Info", f"Document mode uses one model • {model.upper()}", BRIGHT_YELLOW if ANSI_ENABLED else "")
+            usage = load_usage() if model != "local-llm" else None
+            process_document(args.document, task, model, usage)
+        elif args.watch:
+            watch_clipboard()
+        else:
+            prompt_flow()
     except KeyboardInterrupt:
         pass
     finally:
         is_running = False
         executor.shutdown(wait=True)
+        summary_executor.shutdown(wait=True)
+        shutdown_local_pool()
+        dedup = get_singleflight_stats()
+        if dedup["shared"]:
+            print_info_box("[*] Deduplication", f"{dedup['shared']} of {dedup['calls']} requests shared an in-flight call ({dedup['hit_rate']:.0%})", BRIGHT_MAGENTA if ANSI_ENABLED else "")
         if ANSI_ENABLED:
             print(f"\n{BRIGHT_GREEN}[*] Goodbye!{RESET}")
         else:
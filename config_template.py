@@ -12,6 +12,54 @@ DEFAULT_MODEL = "gpt-3.5-turbo"  # Default model
 WRAP_WIDTH = 80  # Text wrapping width
 WRAP_INDENT = "  "  # Indentation for wrapped text
 
+# Optional: instructions sent first with every online request. Keep this fixed:
+# it starts the prompt prefix the provider can cache
+SYSTEM_PROMPT = "You are a helpful AI typing assistant. Answer clearly and concisely."
+
+# Optional: OpenAI-compatible endpoint, e.g. the local stand-in server
+# started with `python mock_server.py` (None = api.openai.com)
+BASE_URL = None  # e.g. "http://127.0.0.1:8088/v1"
+
+# Optional: clipboard watch mode (python ai_typing_assistant.py --watch)
+WATCH_MIN_INTERVAL = 0.2  # Fastest clipboard poll, used right after activity (seconds)
+WATCH_MAX_INTERVAL = 2.0  # Slowest clipboard poll, reached when idle (seconds)
+WATCH_DEBOUNCE = 0.8  # Clipboard must stay unchanged this long before submitting
+
+# Optional: offline backend
+LOCAL_BACKEND = None  # "module:factory" returning a callable(prompt) -> reply; None = built-in
+LOCAL_WORKERS = 0  # Worker processes for the offline model (0 = in-process; --batch uses all cores)
+
+# Optional: rolling summary of older exchanges. Up to 10 recent exchanges are sent verbatim;
+# at 10 (or 10,000 characters) all but the last 5 or fewer are folded in as one block
+SUMMARY_MODEL = None  # Cheap model that updates the summary (None = offline extractive summary)
+SUMMARY_MAX_CHARS = 2000  # Size cap for the summary sent with each request
+
+# Optional: online request timing
+API_TIMEOUT = 30  # Longest time for a whole reply; waits for the first token are learned from observed latency
+HEDGE_REQUESTS = False  # Send a second request when the first token is later than the observed p95
+HEDGE_MAX_FRACTION = 0.1  # At most this share of requests may be hedged
+REQUEST_CONCURRENCY = 4  # Upstream calls at once (daemon clients, race/compare branches)
+
+# Optional: circuit breaker (falls back to the local model while the API is down)
+BREAKER_THRESHOLD = 3  # Consecutive timeouts/connection/5xx errors before falling back
+BREAKER_PROBE_INTERVAL = 15  # Seconds between background checks (one-token completions) for the API coming back
+
+# Optional: metrics export in Prometheus text format
+METRICS_PORT = None  # e.g. 9464 to serve http://127.0.0.1:9464/metrics
+METRICS_TEXTFILE = None  # e.g. a node_exporter textfile collector path ending in .prom
+METRICS_INTERVAL = 15  # Seconds between textfile rewrites
+
+# Optional: document mode (python ai_typing_assistant.py --document FILE --task "...")
+DOCUMENT_CHUNK_TOKENS = 2000  # Approximate tokens per chunk (chunks end on paragraph boundaries)
+DOCUMENT_CONCURRENCY = 4  # Chunks processed at the same time
+DOCUMENT_RETRIES = 3  # Retries per chunk after rate-limit or outage errors
+
+# Optional: models used by the race and compare modes in the model menu
+FANOUT_MODELS = ["gpt-3.5-turbo", "gpt-4o"]  # May include "local-llm"
+
+# Optional: daemon mode (python ai_typing_assistant.py --daemon, then ai_client.py)
+DAEMON_SOCKET = None  # Unix socket path (None = ~/Documents/248Tech/assistant.sock)
+
 """
 Instructions:
 1. Copy this file to config.py
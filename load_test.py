@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Load generator for the AI Typing Assistant request path
+
+Sends requests through the assistant's own call_online (shared executor,
+adaptive timeouts, hedging, in-flight sharing, circuit breaker and usage
+billing) against the local stand-in server (mock_server.py) or any compatible
+endpoint, and reports throughput and latency percentiles. The assistant runs
+with a throwaway config and home directory, so real usage is left alone.
+
+    python mock_server.py --latency 0.2 --jitter 0.1 --quiet &
+    python load_test.py --requests 200 --concurrency 8
+"""
+
+import sys
+import time
+import shutil
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from mock_server import DEFAULT_HOST, DEFAULT_PORT, isolate_assistant
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+def run_one(assistant, model, prompt, usage):
+    """Issue one request; return (latency, time to first token, completion tokens)"""
+    started = time.perf_counter()
+    _, _, _, result = assistant.call_online(model, [{"role": "user", "content": prompt}], usage)
+    elapsed = time.perf_counter() - started
+    return elapsed, result["first_token"] or result["latency"], result["completion_tokens"]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure the assistant's request-path throughput against a chat-completions endpoint")
+    parser.add_argument("--base-url", default=f"http://{DEFAULT_HOST}:{DEFAULT_PORT}/v1")
+    parser.add_argument("--api-key", default="stand-in")
+    parser.add_argument("--model", default="gpt-3.5-turbo")
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--hedge", action="store_true", help="turn on hedged requests (HEDGE_REQUESTS)")
+    parser.add_argument("--prompt", default="Summarize the benefits of local load testing.")
+    parser.add_argument("--timeout", type=float, default=30.0, help="API_TIMEOUT for the run (seconds)")
+    options = parser.parse_args(argv)
+
+    workdir = isolate_assistant("ai-load-", options.base_url, options.model, options.api_key,
+                                API_TIMEOUT=options.timeout,
+                                REQUEST_CONCURRENCY=options.concurrency,
+                                HEDGE_REQUESTS=options.hedge)
+    import ai_typing_assistant as assistant
+    if not assistant.HAS_API_KEY or not assistant.ensure_dirs():
+        print("[!] Could not initialize the assistant", file=sys.stderr)
+        shutil.rmtree(workdir, ignore_errors=True)
+        return 1
+    usage = assistant.load_usage()
+
+    latencies = []
+    first_tokens = []
+    errors = []
+    total_tokens = [0]
+    lock = threading.Lock()
+
+    def worker(i):
+        try:
+            elapsed, ttft, tokens = run_one(assistant, options.model, f"{options.prompt} #{i}", usage)
+        except Exception as e:
+            with lock:
+                errors.append(type(e).__name__)
+            return
+        with lock:
+            latencies.append(elapsed)
+            first_tokens.append(ttft)
+            total_tokens[0] += tokens
+
+    started = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(max_workers=options.concurrency) as pool:
+            list(pool.map(worker, range(options.requests)))
+    finally:
+        assistant.executor.shutdown(wait=True)
+        assistant.summary_executor.shutdown(wait=True)
+        shutil.rmtree(workdir, ignore_errors=True)
+    wall = time.perf_counter() - started
+
+    print(f"Requests:    {options.requests} ({len(errors)} failed) at concurrency {options.concurrency}")
+    print(f"Wall time:   {wall:.2f}s")
+    print(f"Throughput:  {len(latencies) / wall:.1f} req/s, {total_tokens[0] / wall:.1f} completion tokens/s")
+    print(f"Latency:     p50 {percentile(latencies, 50) * 1000:.0f}ms  "
+          f"p95 {percentile(latencies, 95) * 1000:.0f}ms  p99 {percentile(latencies, 99) * 1000:.0f}ms")
+    print(f"First token: p50 {percentile(first_tokens, 50) * 1000:.0f}ms  "
+          f"p95 {percentile(first_tokens, 95) * 1000:.0f}ms")
+    if options.hedge:
+        print(f"Hedges:      {assistant.hedge_stats['hedged']} of {assistant.hedge_stats['requests']} requests")
+    if errors:
+        kinds = {name: errors.count(name) for name in set(errors)}
+        print(f"Errors:      {kinds}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
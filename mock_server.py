@@ -0,0 +1,455 @@
+#!/usr/bin/env python3
+"""
+Local OpenAI-compatible stand-in server for AI Typing Assistant
+
+Speaks the chat-completions protocol (streaming included) so the assistant
+can be exercised without network access or API spend. Point the assistant
+at it with BASE_URL = "http://127.0.0.1:8088/v1" in config.py.
+
+Modes:
+    python mock_server.py                                  # synthetic replies
+    python mock_server.py --record session.json --upstream https://api.openai.com/v1 --api-key sk-...
+    python mock_server.py --replay session.json            # deterministic replay
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import hashlib
+import argparse
+import tempfile
+import threading
+import collections
+import urllib.request
+import urllib.error
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8088
+
+# Prompt caching as the OpenAI API reports it: prefixes of at least
+# CACHE_MIN_TOKENS are cached, and hits are counted in CACHE_INCREMENT steps
+CACHE_MIN_TOKENS = 1024
+CACHE_INCREMENT = 128
+CACHE_ENTRIES = 4096
+
+FILLER_WORDS = [
+    "the", "assistant", "reply", "is", "generated", "locally", "for", "testing",
+    "latency", "and", "throughput", "without", "network", "access", "or", "cost",
+]
+
+# === HELPERS ===
+def estimate_tokens(text):
+    """Rough token estimate (about four characters per token)"""
+    return max(1, len(text) // 4)
+
+def request_key(body):
+    """Stable key for a chat request, used to match cassette recordings"""
+    relevant = {
+        "model": body.get("model"),
+        "messages": body.get("messages"),
+        "stream": bool(body.get("stream")),
+    }
+    encoded = json.dumps(relevant, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+def synthetic_reply(body, reply_tokens):
+    """Build a deterministic reply from the request contents"""
+    messages = body.get("messages") or []
+    last = messages[-1].get("content", "") if messages else ""
+    rng = random.Random(request_key(body))
+    words = ["Stand-in", "reply", "to:"] + str(last).split()[:8]
+    while len(words) < reply_tokens:
+        words.append(rng.choice(FILLER_WORDS))
+    return " ".join(words[:max(reply_tokens, 1)])
+
+def completion_body(model, content, prompt_tokens, completion_tokens, cached_tokens=0):
+    """Non-streaming chat.completion response body"""
+    return {
+        "id": f"chatcmpl-local-{int(time.time() * 1000)}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": content},
+            "finish_reason": "stop",
+        }],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+            "prompt_tokens_details": {"cached_tokens": cached_tokens},
+        },
+    }
+
+def chunk_body(model, delta, finish_reason=None, usage=None):
+    """Streaming chat.completion.chunk body"""
+    chunk = {
+        "id": "chatcmpl-local-stream",
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [] if usage else [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+    }
+    if usage:
+        chunk["usage"] = usage
+    return chunk
+
+# === CASSETTES ===
+class Cassette:
+    """Recorded request/response pairs stored as a JSON file"""
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.interactions = []
+        self.cursors = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                self.interactions = json.load(f).get("interactions", [])
+
+    def record(self, key, request, status, body=None, events=None):
+        """Append an interaction and rewrite the cassette file"""
+        entry = {"key": key, "request": request, "status": status}
+        if events is not None:
+            entry["events"] = events
+        else:
+            entry["body"] = body
+        with self.lock:
+            self.interactions.append(entry)
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"version": 1, "interactions": self.interactions}, f, indent=2, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+
+    def next_for(self, key):
+        """Return the next recording for a key, cycling through repeats in order"""
+        with self.lock:
+            matches = [entry for entry in self.interactions if entry["key"] == key]
+            if not matches:
+                return None
+            index = self.cursors.get(key, 0)
+            self.cursors[key] = index + 1
+            return matches[index % len(matches)]
+
+# === REQUEST HANDLER ===
+class ChatHandler(BaseHTTPRequestHandler):
+    """Handle /v1/chat/completions and /v1/models"""
+
+    protocol_version = "HTTP/1.1"
+    server_version = "AITypingAssistantStandIn/1.0"
+
+    def log_message(self, format, *args):
+        if not self.server.options.quiet:
+            super().log_message(format, *args)
+
+    # --- plumbing ---
+    def send_json(self, status, payload):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def send_error_json(self, status, message, error_type="server_error"):
+        self.send_json(status, {"error": {"message": message, "type": error_type, "code": status}})
+
+    def start_stream(self):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+    def send_event(self, data):
+        self.wfile.write(f"data: {data}\n\n".encode("utf-8"))
+        self.wfile.flush()
+
+    # --- routes ---
+    def do_GET(self):
+        if self.path.rstrip("/").endswith("/models"):
+            models = [{"id": name, "object": "model", "owned_by": "local"} for name in ("gpt-3.5-turbo", "gpt-4o")]
+            self.send_json(200, {"object": "list", "data": models})
+        else:
+            self.send_error_json(404, f"Unknown path {self.path}", "not_found")
+
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self.send_error_json(404, f"Unknown path {self.path}", "not_found")
+            return
+
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            body = json.loads(self.rfile.read(length) or b"{}")
+        except (ValueError, json.JSONDecodeError):
+            self.send_error_json(400, "Request body is not valid JSON", "invalid_request_error")
+            return
+
+        self.server.stats.count("requests")
+        try:
+            if self.server.cassette and self.server.options.replay:
+                self.handle_replay(body)
+            elif self.server.cassette and self.server.options.record:
+                self.handle_record(body)
+            else:
+                self.handle_synthetic(body)
+        except (BrokenPipeError, ConnectionResetError):
+            # Client went away mid-response (cancelled or timed out)
+            self.server.stats.count("disconnects")
+
+    def handle_synthetic(self, body):
+        options = self.server.options
+        self.server.inject_latency()
+
+        status = self.server.injected_error()
+        if status:
+            self.server.stats.count("errors")
+            self.send_error_json(status, f"Injected error {status}", "injected_error")
+            return
+
+        model = body.get("model", "gpt-3.5-turbo")
+        prompt_text = " ".join(str(m.get("content", "")) for m in body.get("messages") or [])
+        prompt_tokens = estimate_tokens(prompt_text)
+        cached_tokens = 0
+        if self.server.prompt_cache:
+            cached_tokens = min(prompt_tokens, self.server.prompt_cache.lookup(model, body.get("messages") or []))
+            if cached_tokens:
+                self.server.stats.count("cache_hits")
+        content = synthetic_reply(body, options.reply_tokens)
+        words = content.split(" ")
+        token_delay = 1.0 / options.token_rate if options.token_rate > 0 else 0
+
+        if body.get("stream"):
+            self.start_stream()
+            self.send_event(json.dumps(chunk_body(model, {"role": "assistant", "content": ""})))
+            for i, word in enumerate(words):
+                if token_delay:
+                    time.sleep(token_delay)
+                piece = word if i == 0 else " " + word
+                self.send_event(json.dumps(chunk_body(model, {"content": piece})))
+            self.send_event(json.dumps(chunk_body(model, {}, finish_reason="stop")))
+            if (body.get("stream_options") or {}).get("include_usage"):
+                usage = completion_body(model, content, prompt_tokens, len(words), cached_tokens)["usage"]
+                self.send_event(json.dumps(chunk_body(model, None, usage=usage)))
+            self.send_event("[DONE]")
+        else:
+            if token_delay:
+                time.sleep(token_delay * len(words))
+            self.send_json(200, completion_body(model, content, prompt_tokens, len(words), cached_tokens))
+
+    def handle_replay(self, body):
+        entry = self.server.cassette.next_for(request_key(body))
+        if entry is None:
+            self.server.stats.count("errors")
+            self.send_error_json(404, "No recording for this request in the cassette", "cassette_miss")
+            return
+
+        self.server.inject_latency()
+        if "events" in entry:
+            self.start_stream()
+            started = time.monotonic()
+            for offset, data in entry["events"]:
+                if self.server.options.replay_timing:
+                    wait = offset - (time.monotonic() - started)
+                    if wait > 0:
+                        time.sleep(wait)
+                self.send_event(data)
+        else:
+            self.send_json(entry["status"], entry["body"])
+
+    def handle_record(self, body):
+        options = self.server.options
+        key = request_key(body)
+        upstream_request = urllib.request.Request(
+            options.upstream.rstrip("/") + "/chat/completions",
+            data=json.dumps(body).encode("utf-8"),
+            headers={
+                "Content-Type": "application/json",
+                "Authorization": f"Bearer {options.api_key}",
+            },
+            method="POST",
+        )
+        try:
+            upstream = urllib.request.urlopen(upstream_request, timeout=options.upstream_timeout)
+        except urllib.error.HTTPError as e:
+            raw = e.read()
+            try:
+                error_body = json.loads(raw or b"{}")
+            except ValueError:
+                # Not JSON (e.g. an HTML 502 from a proxy): keep the text in an API-style error
+                text = raw.decode("utf-8", errors="replace").strip()
+                error_body = {"error": {"message": text or e.reason, "type": "upstream_error", "code": e.code}}
+            self.server.cassette.record(key, body, e.code, body=error_body)
+            self.send_json(e.code, error_body)
+            return
+        except urllib.error.URLError as e:
+            self.send_error_json(502, f"Upstream unreachable: {e.reason}", "upstream_error")
+            return
+
+        with upstream:
+            if body.get("stream"):
+                self.start_stream()
+                events = []
+                started = time.monotonic()
+                for raw in upstream:
+                    line = raw.decode("utf-8").strip()
+                    if not line.startswith("data:"):
+                        continue
+                    data = line[len("data:"):].strip()
+                    events.append([round(time.monotonic() - started, 4), data])
+                    self.send_event(data)
+                self.server.cassette.record(key, body, 200, events=events)
+            else:
+                response_body = json.loads(upstream.read())
+                self.server.cassette.record(key, body, upstream.status, body=response_body)
+                self.send_json(upstream.status, response_body)
+
+# === SERVER ===
+class ServerStats:
+    """Thread-safe request counters printed on shutdown"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counts = {"requests": 0, "errors": 0, "disconnects": 0}
+
+    def count(self, name):
+        with self.lock:
+            self.counts[name] = self.counts.get(name, 0) + 1
+
+class PrefixCache:
+    """Remembers message-list prefixes to report cached prompt tokens"""
+
+    def __init__(self, capacity=CACHE_ENTRIES):
+        self.lock = threading.Lock()
+        self.capacity = capacity
+        self.prefixes = collections.OrderedDict()
+
+    def lookup(self, model, messages):
+        """Return cached tokens for this request and remember its prefixes"""
+        digest = hashlib.sha256(str(model).encode("utf-8"))
+        tokens = 0
+        cached = 0
+        with self.lock:
+            for message in messages:
+                digest.update(json.dumps(message, sort_keys=True, ensure_ascii=False).encode("utf-8"))
+                tokens += estimate_tokens(str(message.get("content", "")))
+                key = digest.hexdigest()
+                if key in self.prefixes:
+                    self.prefixes.move_to_end(key)
+                    cached = tokens
+                elif tokens >= CACHE_MIN_TOKENS:
+                    self.prefixes[key] = True
+                    if len(self.prefixes) > self.capacity:
+                        self.prefixes.popitem(last=False)
+        if cached < CACHE_MIN_TOKENS:
+            return 0
+        return cached - cached % CACHE_INCREMENT
+
+class StandInServer(ThreadingHTTPServer):
+    """HTTP server carrying the fault-injection options and cassette"""
+
+    daemon_threads = True
+
+    def __init__(self, address, options):
+        super().__init__(address, ChatHandler)
+        self.options = options
+        self.stats = ServerStats()
+        self.prompt_cache = None if options.no_prompt_cache else PrefixCache()
+        self.rng = random.Random(options.seed)
+        self.rng_lock = threading.Lock()
+        cassette_path = options.replay or options.record
+        self.cassette = Cassette(cassette_path) if cassette_path else None
+
+    def inject_latency(self):
+        """Sleep for the configured base latency, jitter and slow-tail delay"""
+        options = self.options
+        with self.rng_lock:
+            delay = options.latency + self.rng.uniform(0, options.jitter)
+            if options.slow_rate and self.rng.random() < options.slow_rate:
+                delay += options.slow_latency
+        if delay > 0:
+            time.sleep(delay)
+
+    def injected_error(self):
+        """Return an HTTP status to fail with, or None"""
+        with self.rng_lock:
+            if self.options.error_rate and self.rng.random() < self.options.error_rate:
+                return self.rng.choice(self.options.error_status)
+        return None
+
+# === ASSISTANT HARNESS ===
+def isolate_assistant(prefix, base_url, model, api_key="stand-in", **settings):
+    """Give the assistant a throwaway home and config.py pointed at base_url
+    
+    The assistant reads config.py and writes under ~/Documents, so harnesses
+    (load_test.py, soak_test.py) call this before importing it. Extra
+    settings are written to config.py as well. Returns the directory.
+    """
+    workdir = tempfile.mkdtemp(prefix=prefix)
+    config = {
+        "API_KEY": api_key,
+        "MAX_YEARLY_COST": 1_000_000.0,
+        "DEFAULT_MODEL": model,
+        "WRAP_WIDTH": 80,
+        "WRAP_INDENT": "  ",
+        "BASE_URL": base_url,
+        **settings,
+    }
+    with open(os.path.join(workdir, "config.py"), "w") as f:
+        for name, value in config.items():
+            f.write(f"{name} = {value!r}\n")
+    
+    os.environ["HOME"] = workdir
+    os.environ["USERPROFILE"] = workdir
+    sys.path.insert(0, workdir)
+    sys.modules.pop("config", None)
+    return workdir
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Local OpenAI-compatible stand-in server")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--latency", type=float, default=0.0, help="base delay before responding (seconds)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="extra uniform random delay (seconds)")
+    parser.add_argument("--slow-rate", type=float, default=0.0, help="fraction of requests given the slow-tail delay")
+    parser.add_argument("--slow-latency", type=float, default=5.0, help="slow-tail delay (seconds)")
+    parser.add_argument("--token-rate", type=float, default=0.0, help="completion tokens per second (0 = instant)")
+    parser.add_argument("--reply-tokens", type=int, default=40, help="length of synthetic replies")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests that fail")
+    parser.add_argument("--error-status", type=int, nargs="+", default=[500], help="status codes used for injected errors")
+    parser.add_argument("--no-prompt-cache", action="store_true", help="never report cached prompt tokens")
+    parser.add_argument("--seed", type=int, default=0, help="seed for latency and error injection")
+    parser.add_argument("--record", metavar="CASSETTE", help="proxy to --upstream and record to this cassette")
+    parser.add_argument("--replay", metavar="CASSETTE", help="serve responses from this cassette")
+    parser.add_argument("--replay-timing", action="store_true", help="reproduce recorded stream timing on replay")
+    parser.add_argument("--upstream", default="https://api.openai.com/v1", help="upstream API for --record")
+    parser.add_argument("--api-key", default=os.environ.get("OPENAI_API_KEY", ""), help="upstream API key for --record")
+    parser.add_argument("--upstream-timeout", type=float, default=60.0)
+    parser.add_argument("--quiet", action="store_true", help="suppress per-request logging")
+    options = parser.parse_args(argv)
+    if options.record and options.replay:
+        parser.error("--record and --replay are mutually exclusive")
+    if options.record and not options.api_key:
+        parser.error("--record needs --api-key or OPENAI_API_KEY")
+    return options
+
+def main(argv=None):
+    options = parse_args(argv)
+    server = StandInServer((options.host, options.port), options)
+    mode = "replay" if options.replay else "record" if options.record else "synthetic"
+    print(f"[*] Stand-in server ({mode}) on http://{options.host}:{server.server_port}/v1")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(f"\n[*] Served {server.stats.counts}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+"""
+Soak test for the AI Typing Assistant prompt loop
+
+Runs the real prompt_flow loop for many turns against the in-process
+stand-in server (mock_server.py), with scripted input and a throwaway home
+directory. Samples RSS, traced Python memory and per-turn latency (with
+context building, log and usage writes and rendering timed separately), and
+exits non-zero when memory growth or latency drift exceeds the thresholds.
+
+    python soak_test.py --turns 20000
+    python soak_test.py --turns 2000 --max-latency-drift 1.3 --keep
+
+Tracing allocations makes each turn several times slower and its snapshots
+add some RSS of their own; --no-tracemalloc gives the cleanest RSS and
+latency figures for very long runs.
+"""
+
+import gc
+import os
+import sys
+import time
+import random
+import shutil
+import argparse
+import builtins
+import threading
+import contextlib
+import tracemalloc
+
+from mock_server import DEFAULT_HOST, FILLER_WORDS, StandInServer, isolate_assistant, parse_args as server_args
+
+MB = 1024 * 1024
+
+# Allocations made by the harness and the stand-in server are not the assistant's
+HARNESS_FILES = ["*/soak_test.py", "*/mock_server.py", tracemalloc.__file__]
+
+# Assistant functions timed separately within each turn
+COMPONENTS = {
+    "build_messages": "context",
+    "append_to_log": "log",
+    "save_usage": "usage",
+    "print_response_box": "render",
+    "print_cost_summary": "render",
+}
+
+def rss_bytes():
+    """Current resident set size less tracemalloc's own bookkeeping
+    
+    Falls back to the peak size where /proc is unavailable.
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            rss = int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        rss = peak if sys.platform == "darwin" else peak * 1024
+    return rss - tracemalloc.get_tracemalloc_memory()
+
+def traced_bytes(snapshot):
+    """Traced memory in a snapshot, leaving out the harness's own allocations"""
+    filters = [tracemalloc.Filter(False, pattern) for pattern in HARNESS_FILES]
+    return sum(stat.size for stat in snapshot.filter_traces(filters).statistics("filename"))
+
+def median(values):
+    """Median of a list of numbers"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    middle = len(ordered) // 2
+    if len(ordered) % 2:
+        return ordered[middle]
+    return (ordered[middle - 1] + ordered[middle]) / 2
+
+class ScriptedInput:
+    """Stands in for input(): feeds prompts and measures each turn in between"""
+
+    def __init__(self, options, sample):
+        self.options = options
+        self.sample = sample
+        self.rng = random.Random(options.seed)
+        self.turn = 0
+        self.turn_started = None
+        self.timings = {}  # Component -> seconds spent in the current turn
+        self.latencies = []  # Per turn: (total seconds, {component: seconds})
+
+    def instrument(self, module, name, component):
+        """Wrap module.name so its time counts towards component in the current turn"""
+        original = getattr(module, name)
+
+        def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - started
+                self.timings[component] = self.timings.get(component, 0.0) + elapsed
+
+        setattr(module, name, timed)
+
+    def __call__(self, prompt=""):
+        if self.turn_started is not None:
+            self.latencies.append((time.perf_counter() - self.turn_started, self.timings))
+            self.timings = {}
+        self.turn += 1
+        if self.turn > self.options.turns:
+            return ""  # An empty prompt ends prompt_flow's loop
+        if self.turn == self.options.warmup:
+            self.sample(self.turn, "baseline")
+        elif self.turn == 1 or self.turn % self.options.sample_every == 0:
+            self.sample(self.turn)
+
+        words = [self.rng.choice(FILLER_WORDS) for _ in range(self.rng.randint(3, self.options.prompt_words))]
+        self.turn_started = time.perf_counter()
+        return f"Turn {self.turn}: " + " ".join(words)
+
+def window_median(latencies, start, size, component=None):
+    """Median latency over a window of turns, in total or for one component"""
+    values = []
+    for total, parts in latencies[start:start + size]:
+        values.append(total if component is None else parts.get(component, 0.0))
+    return median(values)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Soak the assistant's prompt loop and check memory and latency stay flat")
+    parser.add_argument("--turns", type=int, default=20000)
+    parser.add_argument("--warmup", type=int, default=500, help="turns before the memory and latency baseline")
+    parser.add_argument("--sample-every", type=int, default=1000, help="turns between memory samples")
+    parser.add_argument("--window", type=int, default=500, help="turns in the first and last latency windows")
+    parser.add_argument("--model", default="gpt-3.5-turbo")
+    parser.add_argument("--prompt-words", type=int, default=20)
+    parser.add_argument("--reply-tokens", type=int, default=40)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--max-rss-growth", type=float, default=64.0, help="allowed RSS growth after warmup (MB)")
+    parser.add_argument("--max-traced-growth", type=float, default=16.0, help="allowed traced Python memory growth after warmup (MB)")
+    parser.add_argument("--max-latency-drift", type=float, default=1.5, help="allowed ratio of last to first window median latency")
+    parser.add_argument("--latency-floor", type=float, default=1.0, help="drift smaller than this many ms is ignored as noise")
+    parser.add_argument("--no-tracemalloc", action="store_true", help="skip traced memory (faster)")
+    parser.add_argument("--keep", action="store_true", help="keep the temporary home directory")
+    options = parser.parse_args(argv)
+    options.window = max(1, min(options.window, options.turns // 2))
+    options.warmup = max(1, min(options.warmup, options.turns - 2 * options.window))
+
+    # Stand-in backend in this process, on a free port
+    server = StandInServer((DEFAULT_HOST, 0), server_args(["--quiet", "--reply-tokens", str(options.reply_tokens)]))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    workdir = isolate_assistant("ai-soak-", f"http://{DEFAULT_HOST}:{server.server_port}/v1", options.model, "soak-test")
+
+    if not options.no_tracemalloc:
+        tracemalloc.start()
+    import ai_typing_assistant as assistant
+
+    # Keep the real clipboard out of it
+    clipboard = [""]
+    assistant.pyperclip.copy = lambda text: clipboard.__setitem__(0, text)
+    assistant.pyperclip.paste = lambda: clipboard[0]
+
+    samples = []  # (turn, rss bytes, traced bytes)
+    snapshots = {}  # Name -> snapshot file, kept on disk so they don't inflate RSS
+
+    def sample(turn, name=None):
+        gc.collect()  # Count only memory that is still reachable
+        rss = rss_bytes()
+        traced = 0
+        if tracemalloc.is_tracing():
+            snapshot = tracemalloc.take_snapshot()
+            traced = traced_bytes(snapshot)
+            if name:
+                snapshots[name] = os.path.join(workdir, f"{name}.snapshot")
+                snapshot.dump(snapshots[name])
+            del snapshot
+        samples.append((turn, rss, traced))
+        print(f"[*] turn {turn:>6}  rss {samples[-1][1] / MB:7.1f} MB  traced {traced / MB:7.1f} MB",
+              file=sys.stderr, flush=True)
+
+    scripted = ScriptedInput(options, sample)
+    for name, component in COMPONENTS.items():
+        scripted.instrument(assistant, name, component)
+
+    if not assistant.ensure_dirs():
+        print("[!] Could not initialize the assistant's directories", file=sys.stderr)
+        return 1
+    assistant.selected_model = options.model
+
+    started = time.perf_counter()
+    original_input = builtins.input
+    builtins.input = scripted
+    try:
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            assistant.prompt_flow()
+    finally:
+        builtins.input = original_input
+        assistant.executor.shutdown(wait=True)
+        assistant.summary_executor.shutdown(wait=True)
+        server.shutdown()
+    wall = time.perf_counter() - started
+    sample(scripted.turn - 1, "final")
+
+    # === REPORT ===
+    failures = []
+    latencies = scripted.latencies
+    completed = len(latencies)
+    print(f"Turns:       {completed} of {options.turns} in {wall:.1f}s ({completed / wall:.1f} turns/s)")
+    if completed < options.turns:
+        failures.append(f"prompt loop stopped after {completed} turns")
+
+    baseline = next((s for s in samples if s[0] == options.warmup), samples[0])
+    final = samples[-1]
+    rss_growth = (final[1] - baseline[1]) / MB
+    print(f"RSS:         {baseline[1] / MB:.1f} MB at turn {baseline[0]} -> {final[1] / MB:.1f} MB ({rss_growth:+.1f} MB)")
+    if rss_growth > options.max_rss_growth:
+        failures.append(f"RSS grew {rss_growth:.1f} MB (limit {options.max_rss_growth:.1f} MB)")
+    if tracemalloc.is_tracing():
+        traced_growth = (final[2] - baseline[2]) / MB
+        print(f"Traced:      {baseline[2] / MB:.1f} MB at turn {baseline[0]} -> {final[2] / MB:.1f} MB ({traced_growth:+.1f} MB)")
+        if traced_growth > options.max_traced_growth:
+            failures.append(f"traced memory grew {traced_growth:.1f} MB (limit {options.max_traced_growth:.1f} MB)")
+
+    # Compare the first window after warmup with the last one, in total and per component
+    first_start = options.warmup
+    last_start = max(first_start, completed - options.window)
+    floor = options.latency_floor / 1000
+    for component in [None] + sorted(set(COMPONENTS.values())):
+        first = window_median(latencies, first_start, options.window, component)
+        last = window_median(latencies, last_start, options.window, component)
+        label = "Turn" if component is None else f"  {component}"
+        ratio = last / first if first else 1.0
+        print(f"{label + ':':<13}{first * 1000:8.2f} ms -> {last * 1000:8.2f} ms  (x{ratio:.2f})")
+        if last - first > floor and ratio > options.max_latency_drift:
+            failures.append(f"{component or 'turn'} latency drifted x{ratio:.2f} (limit x{options.max_latency_drift:.2f})")
+
+    chat_log = os.path.join(workdir, "Documents", "248Tech", "Logs", "Chat", "chat_log.txt")
+    if os.path.exists(chat_log):
+        print(f"Chat log:    {os.path.getsize(chat_log) / MB:.1f} MB")
+
+    if failures and "baseline" in snapshots:
+        print("Largest allocation growth since warmup:")
+        filters = [tracemalloc.Filter(False, pattern) for pattern in HARNESS_FILES]
+        baseline_traces = tracemalloc.Snapshot.load(snapshots["baseline"]).filter_traces(filters)
+        final_traces = tracemalloc.Snapshot.load(snapshots["final"]).filter_traces(filters)
+        for stat in final_traces.compare_to(baseline_traces, "lineno")[:10]:
+            print(f"  {stat}")
+
+    if options.keep:
+        print(f"Home dir:    {workdir}")
+    else:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if failures:
+        for failure in failures:
+            print(f"[!] FAIL: {failure}")
+        return 1
+    print("[*] PASS")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,32 @@
+"""Document-mode retries back off between attempts and release their budget reservation"""
+
+import pytest
+
+import ai_typing_assistant as assistant
+
+class RateLimited(Exception):
+    status_code = 429
+
+def test_rate_limited_chunk_backs_off_between_attempts(monkeypatch):
+    delays = []
+    attempts = []
+
+    def rate_limited(model, messages, usage, cancel=None):
+        attempts.append(assistant.reserved_cost)
+        raise RateLimited("Too many requests")
+
+    monkeypatch.setattr(assistant, "request_completion", rate_limited)
+    monkeypatch.setattr(assistant, "circuit_open", lambda: False)
+    monkeypatch.setattr(assistant.time, "sleep", delays.append)
+    usage = {"input": 0, "output": 0, "cached": 0, "total": 0.0}
+
+    with pytest.raises(RateLimited):
+        assistant.run_document_request("Summarize this chunk.", "gpt-4o", usage)
+
+    assert len(attempts) == assistant.DOCUMENT_RETRIES + 1
+    assert len(delays) == assistant.DOCUMENT_RETRIES
+    for attempt, delay in enumerate(delays):
+        assert 2 ** attempt <= delay < 2 ** attempt + 1
+    # Each attempt held a reservation, and none is left once the chunk gives up
+    assert all(reserved > 0 for reserved in attempts)
+    assert assistant.reserved_cost == 0.0